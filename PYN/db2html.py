@@ -1,8 +1,9 @@
 import os
-import sqlite3
 
-# SQLiteデータベースに接続
-conn = sqlite3.connect('./settings.db')
+import dbconn
+
+# SQLiteデータベースに接続 (読み取り専用)
+conn = dbconn.connect_readonly('./settings.db')
 cursor = conn.cursor()
 
 # ディレクトリを生成する関数
@@ -122,10 +123,19 @@ for row in settings_data:
                    "FROM Isotopes WHERE setting_id = ?", (id_value,))
     isotope_data = cursor.fetchall()
 
+    # 設定ごとの集計 (取り込み時に作った setting_summary の 1 行)
+    cursor.execute("SELECT total_yield, n_nuclides, center_purity, f7_rate FROM setting_summary WHERE setting_id = ?", (id_value,))
+    total_yield, n_nuclides, center_purity, f7_rate = cursor.fetchone() or (None, None, None, None)
+    purity_text = f"{center_purity:.2f} %" if center_purity is not None else "-"
+    f7_text = f"{f7_rate:.1f}" if f7_rate is not None else "-"
+
     # 個別のhtmlファイルの内容を作成
     isotope_html_content = generate_html_header(f"Isotope Data for Setting ID {id_value}")
     isotope_html_content += f"""
     <h2>Isotope Data for Setting ID {id_value} ({symbol_value})</h2>
+    <p style="text-align: center;">
+        Total Yield: {total_yield or 0:.1f} | Nuclides: {n_nuclides or 0} | Purity ({symbol_value}): {purity_text} | F7 Total Rate: {f7_text}
+    </p>
     <table>
     <tr>
       <th>id</th><th>Isotope Name</th><th>A</th><th>Z</th><th>N</th><th>Yield</th><th>percent1</th><th>x_section</th>
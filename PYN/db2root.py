@@ -1,22 +1,32 @@
-import sqlite3
 from datetime import datetime
+import os
+import time
+import json
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import ROOT
-from ROOT import TCanvas, TLatex, TH2F, TFile
+from ROOT import TCanvas, TLatex, TH2F, TH2D, TH2Poly, TGraph, TExec, TFile, TNamed
+
+import dbconn
+import nuclide
+from lise2db import available_cores
 
 # バッチモードを有効にする
 ROOT.gROOT.SetBatch(True)
 
 # データベースから同位体データと設定を取得
 def fetch_isotope_data_and_symbols(db_path):
-    conn = sqlite3.connect(db_path)
+    conn = dbconn.connect_readonly(db_path)
     cursor = conn.cursor()
 
     # Isotope と Settings を結合してデータを取得
     query = """
     SELECT 
         I.setting_id, 
-        I.Z, 
-        I.N, 
+        I.nuclide_id, 
         I.isotope_name, 
         I.Yield, 
         I.percent1,
@@ -30,25 +40,32 @@ def fetch_isotope_data_and_symbols(db_path):
         Qratio_F3,
         Qratio_F5,
         Unreacted_F5,
-        S.Symbol 
+        S.Symbol,
+        S.fingerprint,
+        M.total_yield 
     FROM 
         Isotopes I 
     JOIN 
         Settings S 
     ON 
         I.setting_id = S.id
+    JOIN 
+        setting_summary M 
+    ON 
+        I.setting_id = M.setting_id
     """
-    cursor.execute(query)
+    cursor.execute(query + " ORDER BY I.setting_id, I.id")
 
     isotopes_by_setting_id = {}
     for row in cursor.fetchall():
-        (setting_id, Z, N, isotope_name, yield_value, percent1, x_section, Transmission, 
+        (setting_id, nuclide_id, isotope_name, yield_value, percent1, x_section, Transmission, 
          Transmission_F1slit, Transmission_F2slit, Transmission_F25slit, 
          Transmission_F5slit, Transmission_F7slit, 
-         Qratio_F3, Qratio_F5, Unreacted_F5, symbol) = row
+         Qratio_F3, Qratio_F5, Unreacted_F5, symbol, fingerprint, total_yield) = row
+        Z, N = nuclide.Z_of(nuclide_id), nuclide.N_of(nuclide_id)  # 核種 ID から Z, N を求める
         
         if setting_id not in isotopes_by_setting_id:
-            isotopes_by_setting_id[setting_id] = {'isotopes': [], 'symbol': symbol}
+            isotopes_by_setting_id[setting_id] = {'isotopes': [], 'symbol': symbol, 'fingerprint': fingerprint, 'total_yield': total_yield}
         isotopes_by_setting_id[setting_id]['isotopes'].append(
             (Z, N, isotope_name, yield_value, percent1, x_section, Transmission, 
              Transmission_F1slit, Transmission_F2slit, Transmission_F25slit, 
@@ -59,8 +76,19 @@ def fetch_isotope_data_and_symbols(db_path):
     conn.close()
     return isotopes_by_setting_id
 
-# 同位体データと設定を取得
-isotopes_by_setting_id = fetch_isotope_data_and_symbols("./settings.db")
+# 描画の仕方を変えたら上げる (manifest の hash が変わり、全設定の ROOT ファイルを作り直す)
+RENDERER_VERSION = 3
+
+# 出力の形式
+#   canvas:     核種名や値の TLatex を描き込んだキャンバス (従来の形式)
+#   histograms: 色付けしていない TH2F と、核種名のラベル (JSON) 1 つだけ。描画は JSROOT の既定の描画オプションか draw_histograms に任せる
+OUTPUT_MODES = ["canvas", "histograms"]
+
+# histograms 形式のヒストグラムに付ける既定の描画オプション (JSROOT で開いたときに使われる)
+HISTOGRAM_DRAW_OPTION = "COLZ TEXT LOGZ"
+
+# 作成済みの ROOT ファイルの記録 ({setting_id: {"hash": ..., "path": ...}})
+MANIFEST_PATH = "./ROOT/manifest.json"
 
 # ヒストグラムを作成する範囲
 Nmin, Nmax = 10, 100  # 中性子数の範囲
@@ -82,22 +110,153 @@ parameters = [
     ("Unreacted_F5", "cUnreacted_F5")
 ]
 
-# 各 setting_id に対して個別にROOTファイルを作成
-for setting_id, data in isotopes_by_setting_id.items():
+# パラメータ名に対応するインデックスを設定 (isotopes のタプルの位置)
+param_index_map = {
+    "Yield": 3,
+    "percent1": 4,
+    "x_section": 5,
+    "Transmission": 6,
+    "Transmission_F1slit": 7,
+    "Transmission_F2slit": 8,
+    "Transmission_F25slit": 9,
+    "Transmission_F5slit": 10,
+    "Transmission_F7slit": 11,
+    "Qratio_F3": 12,
+    "Qratio_F5": 13,
+    "Unreacted_F5": 14
+}
+
+# 値の表示形式 (元の TLatex と同じ書式)
+def value_format(param_name):
+    if param_name == 'Yield':
+        return ".0f"
+    elif param_name == 'x_section':
+        return ".0e"
+    else:
+        return ".2f"
+
+# 核種のリストを配列にまとめる関数 (チャートの範囲内の核種だけ)
+#   Z, N: 整数の配列, names: 核種名のリスト, values: (核種数 × パラメータ数) の配列 (列は param_index_map の位置 - 3)
+def isotope_arrays(isotopes):
+    Z = np.array([isotope[0] for isotope in isotopes], dtype=np.int64)
+    N = np.array([isotope[1] for isotope in isotopes], dtype=np.int64)
+    values = np.array([isotope[3:] for isotope in isotopes], dtype=np.float64).reshape(len(isotopes), -1)
+
+    in_range = (Nmin <= N) & (N <= Nmax) & (Zmin <= Z) & (Z <= Zmax)
+    names = [isotope[2] for isotope, keep in zip(isotopes, in_range) if keep]
+    return Z[in_range], N[in_range], names, values[in_range]
+
+# 2 次元ヒストグラムを作って配列の値を 1 回で詰める関数
+#   dz: Z 方向の bin をずらす量 (TEXT で bin の中心からずらして描くヒストグラム用)
+def filled_th2f(name, title, Z, N, weights, hist_class=TH2F, dz=0.0):
+    h2 = hist_class(name, title, Nmax-Nmin+1, Nmin-0.5, Nmax+0.5, Zmax-Zmin+1, Zmin-0.5+dz, Zmax+0.5+dz)
+    if len(weights):
+        h2.FillN(len(weights), N.astype(np.float64), Z.astype(np.float64) + dz, np.ascontiguousarray(weights, dtype=np.float64))
+        h2.Sumw2(False)  # 重み付きの Fill で作られる誤差の配列は使わない (SetBinContent と同じ中身にしてファイルを小さくする)
+    return h2
+
+# 核種ごとのテキスト (dz: bin の中心からの Z 方向のずれ)
+def text_labels(Z, N, texts, dz, color):
+    labels = []
+    for z, n, text in zip(Z, N, texts):
+        latex = TLatex(float(n), float(z) + dz, text)
+        latex.SetTextSize(0.02)
+        latex.SetTextColor(color)
+        latex.SetTextAlign(22)  # 中央揃え
+        labels.append(latex)
+    return labels
+
+# 値を TEXT オプションで描くためのヒストグラムと、TEXT で描けない値の TLatex のリストを作る関数
+#   fmt は printf の書式から % を除いたもの (gStyle の PaintTextFormat と同じ形, 例: ".2f", ".0e", ".1f %%")
+#   TEXT は空の bin を描かず、Logz では 0 以下の値も描かないので、0 以下の値だけは元と同じ書式の TLatex で描く
+#   値は丸めずに TH2D に入れる (TH2F の float に丸めると、書式で丸めた表示が変わることがある)
+def value_labels(name, Z, N, weights, fmt, dz=0.0):
+    weights = np.asarray(weights, dtype=np.float64)
+    as_text = weights > 0
+    h2_text = filled_th2f(name, "", Z[as_text], N[as_text], weights[as_text], TH2D, dz)
+    h2_text.SetStats(0)
+    h2_text.SetMarkerColor(ROOT.kGray+2)
+    latex_texts = text_labels(Z[~as_text], N[~as_text], [("%" + fmt) % value for value in weights[~as_text]],
+                              dz, ROOT.kGray+2)
+    return (text_format(name, fmt), h2_text), latex_texts
+
+# TEXT の書式を設定する TExec
+#   書式は描画するときの gStyle から読まれるので、キャンバスの TEXT のヒストグラムの前に置いてファイルを開いた側でも同じ書式にする
+def text_format(name, fmt):
+    return TExec(f"{name}_format", f'gStyle->SetPaintTextFormat("{fmt}");')
+
+# 核種名を TEXTN オプションで描くための TH2Poly (核種ごとに bin の中心から dz だけずらした四角形の bin に核種名を付ける)
+def name_labels(name, Z, N, names, dz):
+    h2_names = TH2Poly(name, "", Nmin-0.5, Nmax+0.5, Zmin-0.5, Zmax+0.5)
+    for z, n, isotope_name in zip(Z, N, names):
+        x = np.array([n-0.5, n+0.5, n+0.5, n-0.5], dtype=np.float64)
+        y = np.array([z+dz-0.2, z+dz-0.2, z+dz+0.2, z+dz+0.2], dtype=np.float64)
+        polygon = TGraph(4, x, y)
+        polygon.SetName(isotope_name)
+        polygon.SetLineWidth(0)  # bin の枠は描かない
+        ROOT.SetOwnership(polygon, False)  # bin は TH2Poly が持つ
+        h2_names.AddBin(polygon)
+        h2_names.Fill(float(n), float(z) + dz, 1.0)
+    h2_names.SetStats(0)
+    h2_names.SetMarkerColor(ROOT.kGray+3)
+    return h2_names
+
+# キャンバスにヒストグラムと値・核種名を描く関数 (canvas 形式の出力と draw_histograms で共通)
+#   texts: value_labels() の (TExec, TEXT のヒストグラム) のリスト, labels: TEXT で描けない値の TLatex
+def draw_chart(c1, h2, texts, h2_names, labels):
+    h2.SetStats(1)  # 統計ボックスを表示
+    h2.Draw("COLZ")
+
+    # 同位体の param_value などは TEXT オプションで bin の中央に描く
+    for text_exec, h2_text in texts:
+        text_exec.Draw()
+        h2_text.Draw("TEXT SAME")
+
+    # 同位体名は TEXTN オプションで描く
+    h2_names.Draw("TEXTN SAME")
+
+    for latex in labels:
+        latex.Draw()
+
+# キャンバスを作る関数
+def chart_canvas(canvas_name, title):
+    c1 = TCanvas(canvas_name, title, 1000, 800)
+    c1.SetLogz(1)
+    c1.SetRightMargin(0.15)  # カラーバーのためにマージンを調整
+    c1.SetGrid(1, 1)
+    return c1
+
+# Yield を合計 10000 に正規化した値 (正規化の係数は保存した核種の Yield の合計 (setting_summary) から求める)
+def normalized_yield(values, total_sum):
+    normalization_factor = 10000.0 / total_sum if total_sum > 0 else 0
+    return values[:, param_index_map['Yield'] - 3] * normalization_factor
+
+# 1 つの設定の ROOT ファイルを作成する関数
+def render_setting(setting_id, data, output="canvas"):
+    if output == "histograms":
+        write_histograms(setting_id, data)
+        return
+
     isotopes = data['isotopes']
     symbol = data['symbol']
 
     # ROOTファイルのパス
     #root_file_path = f"./ROOT/BigRIPS_NoXX_136Xe_{symbol}/{setting_id}.root"
     root_file_path = f"./ROOT/{setting_id}.root"
-    
+
     # ディレクトリの作成（存在しない場合）
-    import os
     os.makedirs(os.path.dirname(root_file_path), exist_ok=True)
 
     # ROOTファイルを作成
     root_file = TFile(root_file_path, "RECREATE")
 
+    Z, N, names, values = isotope_arrays(isotopes)
+
+    # 同位体名と ratio_value はどのキャンバスでも同じなので設定ごとに 1 回だけ作る
+    h2_names = name_labels(f"h2_names_{setting_id}", Z, N, names, 0.3)
+    ratio_text, ratio_latex = value_labels(f"h2_percent1_text_{setting_id}", Z, N,
+                                           values[:, param_index_map['percent1'] - 3], ".1f %%", -0.3)
+
     # 各パラメータに対応するキャンバスとヒストグラムを生成
     for param_name, canvas_prefix in parameters:
         if param_name == 'percent1':
@@ -106,140 +265,42 @@ for setting_id, data in isotopes_by_setting_id.items():
         # キャンバスの名前を動的に作成
         canvas_name = f"{canvas_prefix}"
 
-        c1 = TCanvas(canvas_name, f"Nuclear Chart ({param_name}) ({symbol} ID: {setting_id})", 1000, 800)
-        c1.SetLogz(1)
-        c1.SetRightMargin(0.15)  # カラーバーのためにマージンを調整
-
-        # 2次元ヒストグラムを作成してプロットの基礎とする
-        h2 = TH2F(f"h2_{param_name}_{setting_id}", f"Nuclear Chart ({param_name}) ({symbol} ID: {setting_id});Neutron Number (N);Proton Number (Z)", 
-                  Nmax-Nmin+1, Nmin-0.5, Nmax+0.5, Zmax-Zmin+1, Zmin-0.5, Zmax+0.5)
-
-        # パラメータ名に対応するインデックスを設定
-        param_index_map = {
-            "Yield": 3,
-            "percent1": 4,
-            "x_section": 5,
-            "Transmission": 6,
-            "Transmission_F1slit": 7,
-            "Transmission_F2slit": 8,
-            "Transmission_F25slit": 9,
-            "Transmission_F5slit": 10,
-            "Transmission_F7slit": 11,
-            "Qratio_F3": 12,
-            "Qratio_F5": 13,
-            "Unreacted_F5": 14
-        }
-
-        # テキストオブジェクトを保持するリスト
-        text_objects = []
-        text_obj2 = []
-
-        # 各核種のパラメータ値をヒストグラムに設定
-        for isotope in isotopes:
-            Z, N, isotope_name, yield_value, percent1, x_section, Transmission, Transmission_F1slit, Transmission_F2slit, Transmission_F25slit, Transmission_F5slit, Transmission_F7slit, Qratio_F3, Qratio_F5, Unreacted_F5 = isotope
-            
-            # param_nameに対応するインデックスを取得
-            param_value = isotope[param_index_map[param_name]]
-            ratio_value = isotope[param_index_map['percent1']]
-            
-            if Nmin <= N <= Nmax and Zmin <= Z <= Zmax:
-                h2.SetBinContent(N-Nmin+1, Z-Zmin+1, param_value)
-
-                # 同位体名のテキストを描画
-                latex = TLatex(N, Z + 0.3, isotope_name)
-                latex.SetTextSize(0.02)
-                latex.SetTextColor(ROOT.kGray+3)
-                latex.SetTextAlign(22)  # 中央揃え
-                latex.Draw()
-                text_objects.append(latex)
-
-                # 同位体の param_value を isotope_name の下に表示
-                if param_name == 'Yield': 
-                    param_value_text = TLatex(N, Z - 0.0, f"{param_value:.0f}")  # param_valueを表示
-                elif param_name == 'x_section':
-                    param_value_text = TLatex(N, Z - 0.0, f"{param_value:.0e}")  # param_valueを表示
-                else:
-                    param_value_text = TLatex(N, Z - 0.0, f"{param_value:.2f}")  # param_valueを表示
-                param_value_text.SetTextSize(0.02)
-                param_value_text.SetTextColor(ROOT.kGray+2)
-                param_value_text.SetTextAlign(22)  # 中央揃え
-                param_value_text.Draw()
-                text_objects.append(param_value_text)
-
-                if param_name == 'Yield':
-                    # 同位体の ratio_value を isotope_name の下に表示
-                    param_value_text = TLatex(N, Z - 0.3, f"{ratio_value:.1f} %")  # param_valueを表示
-                    param_value_text.SetTextSize(0.02)
-                    param_value_text.SetTextColor(ROOT.kGray+2)
-                    param_value_text.SetTextAlign(22)  # 中央揃え
-                    param_value_text.Draw()
-                    text_objects.append(param_value_text)
-
-                # グリッド線を描画
-                h2.Draw("COLZ SAME")
-                c1.SetGrid(1, 1)
-                c1.RedrawAxis()
-
-        h2.SetStats(1)  # 統計ボックスを表示
-        
-        h2.Draw("COLZ")
+        c1 = chart_canvas(canvas_name, f"Nuclear Chart ({param_name}) ({symbol} ID: {setting_id})")
 
-        # すべてのテキストオブジェクトを再描画
-        for text in text_objects:
-            text.Draw()
+        # 2次元ヒストグラムを作成して、全核種のパラメータ値を 1 回で設定
+        h2 = filled_th2f(f"h2_{param_name}_{setting_id}",
+                         f"Nuclear Chart ({param_name}) ({symbol} ID: {setting_id});Neutron Number (N);Proton Number (Z)",
+                         Z, N, values[:, param_index_map[param_name] - 3])
+        value_text, value_latex = value_labels(f"h2_{param_name}_text_{setting_id}", Z, N,
+                                               values[:, param_index_map[param_name] - 3], value_format(param_name))
+
+        # 同位体名と (Yield の場合は) ratio_value のテキストを描画
+        if param_name == 'Yield':
+            draw_chart(c1, h2, [value_text, ratio_text], h2_names, value_latex + ratio_latex)
+        else:
+            draw_chart(c1, h2, [value_text], h2_names, value_latex)
 
         # キャンバスをROOTファイルに保存
         c1.Write()
 
         # Yield に関するヒストグラムの場合、正規化を行う
         if param_name == "Yield":
-            # 全 bin の合計を取得
-            total_sum = h2.Integral()
-            
+            # 保存した核種の Yield の合計 (setting_summary)
+            total_sum = data['total_yield']
+
+            # 各 bin を 10000 / total_sum で正規化 (全核種の Yield の配列に 1 回掛けるだけ)
+            normalized = normalized_yield(values, total_sum)
+
             # 正規化を行い、新しいヒストグラムを作成
-            h2_Yield_Normalized = TH2F(f"h2_Yield_Normalized_{setting_id}", 
-                                        f"Yield (Normalized: {total_sum:.1f} -> 10000) ({symbol} ID: {setting_id});Neutron Number (N);Proton Number (Z)", 
-                                        Nmax-Nmin+1, Nmin-0.5, Nmax+0.5, Zmax-Zmin+1, Zmin-0.5, Zmax+0.5)
-            
-            # 各 bin を 10000 / total_sum で正規化
-            normalization_factor = 10000.0 / total_sum if total_sum > 0 else 0
-            for x in range(1, h2.GetNbinsX() + 1):
-                for y in range(1, h2.GetNbinsY() + 1):
-                    bin_content = h2.GetBinContent(x, y)
-                    h2_Yield_Normalized.SetBinContent(x, y, bin_content * normalization_factor)
-                    N = x + Nmin - 1
-                    Z = y + Zmin - 1
-
-                    # NとZに基づいて同位体情報を取得
-                    for isotope in isotopes:
-                        isotope_Z, isotope_N, isotope_name, yield_value, percent1, x_section, Transmission, Transmission_F1slit, Transmission_F2slit, Transmission_F25slit, Transmission_F5slit, Transmission_F7slit, Qratio_F3, Qratio_F5, Unrected_F5 = isotope
-                        if isotope_Z == Z and isotope_N == N:
-                            #print(f'isotope_Z: {isotope_Z}, Z: {Z}')
-                            # 同位体名のテキストを描画
-                            latex = TLatex(N, Z + 0.3, isotope_name)
-                            latex.SetTextSize(0.02)
-                            latex.SetTextColor(ROOT.kGray + 3)
-                            latex.SetTextAlign(22)  # 中央揃え
-                            latex.Draw()
-                            text_obj2.append(latex)
-
-                            # 同位体の param_value を isotope_name の下に表示
-                            param_value_text = TLatex(N, Z - 0.0, f"{bin_content * normalization_factor:.0f}")  # yield_valueを表示
-                            param_value_text.SetTextSize(0.02)
-                            param_value_text.SetTextColor(ROOT.kGray + 2)
-                            param_value_text.SetTextAlign(22)  # 中央揃え
-                            param_value_text.Draw()
-                            text_obj2.append(param_value_text)
+            h2_Yield_Normalized = filled_th2f(f"h2_Yield_Normalized_{setting_id}",
+                                              f"Yield (Normalized: {total_sum:.1f} -> 10000) ({symbol} ID: {setting_id});Neutron Number (N);Proton Number (Z)",
+                                              Z, N, normalized)
+
+            # 同位体の正規化した Yield を isotope_name の下に表示 (ラベルは normalized と同じ行の順番)
+            normalized_text, normalized_latex = value_labels(f"h2_Yield_Normalized_text_{setting_id}", Z, N, normalized, ".0f")
 
             # 正規化ヒストグラムを描画
-            h2_Yield_Normalized.SetStats(1)  # 統計ボックスを表示
-            h2_Yield_Normalized.Draw("COLZ")
-
-            for text in text_obj2:
-                text.Draw()
-            
-            c1.SetGrid(1, 1)
-            c1.RedrawAxis()
+            draw_chart(c1, h2_Yield_Normalized, [normalized_text], h2_names, normalized_latex)
             c1.Write()  # 正規化ヒストグラムも保存
 
     # ROOTファイルを閉じる
@@ -247,3 +308,161 @@ for setting_id, data in isotopes_by_setting_id.items():
 
     print(f"Nuclear charts for Setting ID {setting_id} have been saved to {root_file_path}")
 
+# histograms 形式の ROOT ファイルを作成する関数
+#   パラメータごとの TH2F (percent1 も含む) と正規化した Yield の TH2F、
+#   核種名のラベル (TNamed "labels_{setting_id}" のタイトルに bin の並びの JSON {"N": [...], "Z": [...], "name": [...]}) だけを保存する
+def write_histograms(setting_id, data):
+    symbol = data['symbol']
+    root_file_path = f"./ROOT/{setting_id}.root"
+    os.makedirs(os.path.dirname(root_file_path), exist_ok=True)
+    root_file = TFile(root_file_path, "RECREATE")
+
+    Z, N, names, values = isotope_arrays(data['isotopes'])
+
+    for param_name, canvas_prefix in parameters:
+        h2 = filled_th2f(f"h2_{param_name}_{setting_id}",
+                         f"Nuclear Chart ({param_name}) ({symbol} ID: {setting_id});Neutron Number (N);Proton Number (Z)",
+                         Z, N, values[:, param_index_map[param_name] - 3])
+        h2.SetOption(HISTOGRAM_DRAW_OPTION)
+        h2.Write()
+
+    total_sum = data['total_yield']
+    h2_Yield_Normalized = filled_th2f(f"h2_Yield_Normalized_{setting_id}",
+                                      f"Yield (Normalized: {total_sum:.1f} -> 10000) ({symbol} ID: {setting_id});Neutron Number (N);Proton Number (Z)",
+                                      Z, N, normalized_yield(values, total_sum))
+    h2_Yield_Normalized.SetOption(HISTOGRAM_DRAW_OPTION)
+    h2_Yield_Normalized.Write()
+
+    labels = {"N": N.tolist(), "Z": Z.tolist(), "name": names}
+    TNamed(f"labels_{setting_id}", json.dumps(labels, separators=(",", ":"))).Write()
+
+    root_file.Close()
+
+    print(f"Histograms for Setting ID {setting_id} have been saved to {root_file_path}")
+
+# histograms 形式の ROOT ファイルから canvas 形式と同じキャンバスを作る関数 (ROOT 側の描画)
+def draw_histograms(setting_id, root_file_path, output_path):
+    source = TFile.Open(root_file_path)
+    labels = json.loads(source.Get(f"labels_{setting_id}").GetTitle())
+    Z, N = np.array(labels["Z"], dtype=np.int64), np.array(labels["N"], dtype=np.int64)
+
+    # ラベルの核種の bin の値
+    def bin_values(h2):
+        return np.array([h2.GetBinContent(h2.FindBin(float(n), float(z))) for z, n in zip(Z, N)], dtype=np.float64)
+
+    h2_names = name_labels(f"h2_names_{setting_id}", Z, N, labels["name"], 0.3)
+    ratio_text, ratio_latex = value_labels(f"h2_percent1_text_{setting_id}", Z, N,
+                                           bin_values(source.Get(f"h2_percent1_{setting_id}")), ".1f %%", -0.3)
+
+    output_file = TFile(output_path, "RECREATE")
+    charts = [(param_name, canvas_prefix, value_format(param_name)) for param_name, canvas_prefix in parameters if param_name != 'percent1']
+    charts.append(("Yield_Normalized", "cYield_Normalized", ".0f"))
+    for param_name, canvas_prefix, fmt in charts:
+        h2 = source.Get(f"h2_{param_name}_{setting_id}")
+        c1 = chart_canvas(canvas_prefix, h2.GetTitle().split(";")[0])
+        value_text, value_latex = value_labels(f"h2_{param_name}_text_{setting_id}", Z, N, bin_values(h2), fmt)
+        if param_name == 'Yield':
+            draw_chart(c1, h2, [value_text, ratio_text], h2_names, value_latex + ratio_latex)
+        else:
+            draw_chart(c1, h2, [value_text], h2_names, value_latex)
+        c1.Write()
+
+    output_file.Close()
+    source.Close()
+
+    print(f"Nuclear charts for Setting ID {setting_id} have been drawn to {output_path}")
+
+# 設定の ROOT ファイルの元になる内容のハッシュ
+#   (描画に使う同位体の行, 設定のフィンガープリント, 描画範囲, 出力の形式, RENDERER_VERSION)
+def render_hash(data, output="canvas"):
+    content = {
+        "renderer_version": RENDERER_VERSION,
+        "output": output,
+        "range": [Nmin, Nmax, Zmin, Zmax],
+        "fingerprint": data['fingerprint'],
+        "symbol": data['symbol'],
+        "total_yield": data['total_yield'],
+        "isotopes": data['isotopes'],
+    }
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as file:
+        return json.load(file)
+
+# manifest を書き込む関数 (途中で止まっても壊れないように一時ファイルから置き換える)
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+# 1 つの設定の ROOT ファイルを作成して (setting_id, かかった秒数) を返す関数 (ワーカープロセスで実行する)
+def render_setting_timed(item):
+    setting_id, data, output = item
+    start = time.perf_counter()
+    render_setting(setting_id, data, output)
+    return setting_id, time.perf_counter() - start
+
+# 設定の ROOT ファイルを作成して、終わった順に (setting_id, かかった秒数) を返すジェネレータ
+#   jobs > 1 なら設定ごとにワーカープロセスへ振り分ける (ROOT の状態を共有しないように spawn で起動し、
+#   各ワーカーはこのモジュールを読み込み直して自分のバッチモードの ROOT を使う)
+def render_settings(items, jobs=1):
+    if jobs <= 1 or len(items) <= 1:
+        yield from map(render_setting_timed, items)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(jobs, len(items)), mp_context=context) as executor:
+        futures = [executor.submit(render_setting_timed, item) for item in items]
+        for future in as_completed(futures):
+            yield future.result()
+
+# 内容が変わった設定 (と ROOT ファイルがない設定) だけ ROOT ファイルを作り直す関数
+def refresh_settings(isotopes_by_setting_id, jobs=1, force=False, output="canvas", manifest_path=MANIFEST_PATH):
+    start = time.perf_counter()
+    manifest = load_manifest(manifest_path)
+
+    hashes = {str(setting_id): render_hash(data, output) for setting_id, data in isotopes_by_setting_id.items()}
+    pending = []
+    for setting_id, data in isotopes_by_setting_id.items():
+        entry = manifest.get(str(setting_id))
+        if force or entry is None or entry["hash"] != hashes[str(setting_id)] or not os.path.exists(entry["path"]):
+            pending.append((setting_id, data, output))
+
+    for setting_id, elapsed in render_settings(pending, jobs):
+        print(f"Setting ID {setting_id}: {elapsed:.2f} s")
+        manifest[str(setting_id)] = {"hash": hashes[str(setting_id)], "path": f"./ROOT/{setting_id}.root"}
+        save_manifest(manifest, manifest_path)
+
+    print(f"{len(pending)} 個の設定の ROOT ファイルを作成しました "
+          f"(変更なし: {len(isotopes_by_setting_id) - len(pending)} 個, {time.perf_counter() - start:.2f} s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="settings.db から設定ごとの核図表の ROOT ファイルを作成する")
+    parser.add_argument("--db", default="./settings.db", help="SQLite データベースのパス")
+    parser.add_argument("-j", "--jobs", type=int, default=available_cores(),
+                        help="ROOT ファイルを作成するワーカープロセス数 (既定: 使えるコア数)")
+    parser.add_argument("--force", action="store_true",
+                        help="内容が変わっていない設定の ROOT ファイルも作り直す")
+    parser.add_argument("--output", choices=OUTPUT_MODES, default="canvas",
+                        help="canvas: TLatex を描き込んだキャンバス, histograms: TH2F と核種名のラベルだけ (ファイルが小さい)")
+    parser.add_argument("--draw", type=int, metavar="SETTING_ID",
+                        help="histograms 形式の ./ROOT/SETTING_ID.root からキャンバスを ./ROOT/SETTING_ID_canvas.root に描く")
+    args = parser.parse_args()
+
+    if args.draw is not None:
+        draw_histograms(args.draw, f"./ROOT/{args.draw}.root", f"./ROOT/{args.draw}_canvas.root")
+        return
+
+    # 同位体データと設定を取得
+    isotopes_by_setting_id = fetch_isotope_data_and_symbols(args.db)
+
+    # 各 setting_id に対して個別にROOTファイルを作成 (内容が変わった設定だけ)
+    refresh_settings(isotopes_by_setting_id, args.jobs, args.force, args.output)
+
+if __name__ == "__main__":
+    main()
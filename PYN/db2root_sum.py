@@ -1,29 +1,35 @@
-import sqlite3
 import ROOT
 from ROOT import TCanvas, TLatex, TH2F, TFile, TLegend, TBox
 import os
 
+import dbconn
+import nuclide
+
 ROOT.gROOT.SetBatch(True)
 
 def fetch_isotope_data_and_symbols(db_path, setting_ids):
-    conn = sqlite3.connect(db_path)
+    conn = dbconn.connect_readonly(db_path)
     cursor = conn.cursor()
 
     query = """
     SELECT 
         I.setting_id, 
-        I.Z, 
-        I.N, 
+        I.nuclide_id, 
         I.isotope_name, 
         I.Yield, 
         I.percent1,
-        S.Symbol 
+        S.Symbol,
+        M.total_yield 
     FROM 
         Isotopes I 
     JOIN 
         Settings S 
     ON 
         I.setting_id = S.id
+    JOIN 
+        setting_summary M 
+    ON 
+        I.setting_id = M.setting_id
     WHERE
         I.setting_id IN ({})
     """.format(','.join('?' for _ in setting_ids))
@@ -32,10 +38,11 @@ def fetch_isotope_data_and_symbols(db_path, setting_ids):
 
     isotopes_by_setting_id = {}
     for row in cursor.fetchall():
-        (setting_id, Z, N, isotope_name, yield_value, percent1, symbol) = row
+        (setting_id, nuclide_id, isotope_name, yield_value, percent1, symbol, total_yield) = row
+        Z, N = nuclide.Z_of(nuclide_id), nuclide.N_of(nuclide_id)  # 核種 ID から Z, N を求める
         
         if setting_id not in isotopes_by_setting_id:
-            isotopes_by_setting_id[setting_id] = {'isotopes': [], 'symbol': symbol}
+            isotopes_by_setting_id[setting_id] = {'isotopes': [], 'symbol': symbol, 'total_yield': total_yield}
         isotopes_by_setting_id[setting_id]['isotopes'].append(
             (Z, N, isotope_name, yield_value, percent1)
         )
@@ -75,11 +82,8 @@ def create_nuclear_chart(isotopes_by_setting_id, output_path):
 
         boxes.append(box)  # Keep a reference to the box
 
-        yield_sum = 0
-
-        for isotope in isotopes:
-            Z, N, isotope_name, yield_value, percent1 = isotope
-            yield_sum += yield_value
+        # 保存した核種の Yield の合計 (setting_summary)
+        yield_sum = data['total_yield']
 
         for isotope in isotopes:
             Z, N, isotope_name, yield_value, percent1 = isotope
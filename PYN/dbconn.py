@@ -0,0 +1,36 @@
+import sqlite3
+from pathlib import Path
+
+# 既定のデータベースのパス
+DB_PATH = "./settings.db"
+
+# 全スクリプト共通の PRAGMA
+#   WAL にすると、取り込み中でも HTML/ROOT 生成側が同時に読める
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,   # 256 MB
+    "cache_size": -64 * 1024,         # 64 MB (負の値は KiB 単位)
+    "temp_store": "MEMORY",
+    "busy_timeout": 10000,            # ms
+}
+
+# PRAGMA を適用する関数
+def apply_pragmas(conn, read_only=False):
+    for name, value in PRAGMAS.items():
+        # journal_mode の変更は書き込みが必要なので読み取り専用接続では行わない
+        if read_only and name == "journal_mode":
+            continue
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+# 書き込み用の接続を開く関数 (lise2db.py など)
+def connect(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path, timeout=PRAGMAS["busy_timeout"] / 1000)
+    return apply_pragmas(conn)
+
+# 読み取り専用の接続を開く関数 (db2html.py, db2root.py などのレポート生成用)
+def connect_readonly(db_path=DB_PATH):
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=PRAGMAS["busy_timeout"] / 1000)
+    return apply_pragmas(conn, read_only=True)
@@ -0,0 +1,143 @@
+import os
+import shutil
+import sqlite3
+import argparse
+import tempfile
+
+import dbconn
+import schema
+from lise2db import CALCULATIONS_DIR
+
+# ===== 複数の settings.db を 1 つにまとめる ==========================================================
+# 設定はフィンガープリント (schema.settings_fingerprint) で重複を除き、
+# setting_id を参照する各テーブルの行は旧 ID -> 新 ID の対応表との JOIN で一括して付け替える
+
+# setting_id を参照するテーブル (settings の後にこの順番でコピーする)
+#   nuclide_settings は isotopes のトリガーで埋まるのでコピーしない
+SETTING_TABLES = ["isotopes", "charge_states", "charge_state_totals", "setting_summary", "setting_params", "lpp_files", "calculation_files"]
+
+# 両方の DB にある列 (AUTOINCREMENT の id は除く)
+def common_columns(cursor, table):
+    target = [row[1] for row in cursor.execute(f"PRAGMA main.table_info({table})")]
+    source = {row[1] for row in cursor.execute(f"PRAGMA src.table_info({table})")}
+    return [column for column in target if column in source and column != "id"]
+
+# 取り込む DB を読み取り専用で開いて一時ファイルにコピーし、コピーのスキーマを最新にする関数
+#   (取り込む DB 自体は書き換えない。WAL にまだ残っている内容もコピーに含まれる)
+def migrated_copy(source_path, tmp_dir):
+    copy_path = os.path.join(tmp_dir, "source.db")
+    source = dbconn.connect_readonly(source_path)
+    copy = sqlite3.connect(copy_path)
+    source.backup(copy)
+    source.close()
+    with copy:
+        schema.migrate(copy.cursor())
+    copy.close()
+    return copy_path
+
+# 1 つの DB を取り込む関数 ((追加した設定の数, 重複していた設定の数) を返す)
+def merge_database(conn, source_path):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        return merge_migrated(conn, migrated_copy(source_path, tmp_dir), source_path)
+
+# スキーマを最新にした取り込む DB のコピーを ATTACH してまとめる関数
+#   NPY ファイルは元の DB (source_path) の隣の NPY/ から読む
+def merge_migrated(conn, copy_path, source_path):
+    cursor = conn.cursor()
+    cursor.execute("ATTACH DATABASE ? AS src", (copy_path,))
+    try:
+        with conn:
+            # 新しい設定を追加 (同じフィンガープリントが取り込む DB の中に複数あれば最初の 1 つ)
+            columns = ", ".join(common_columns(cursor, "settings"))
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO main.settings ({columns})
+                SELECT {columns} FROM src.settings S
+                WHERE S.id IN (SELECT MIN(id) FROM src.settings GROUP BY fingerprint)
+                  AND NOT EXISTS (SELECT 1 FROM main.settings M WHERE M.fingerprint = S.fingerprint)
+                ORDER BY S.id
+            ''')
+            added = cursor.rowcount
+
+            # 旧 ID -> 新 ID の対応表
+            cursor.execute("DROP TABLE IF EXISTS temp.id_map")
+            cursor.execute("CREATE TEMP TABLE id_map (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+            cursor.execute('''
+                INSERT INTO temp.id_map (old_id, new_id)
+                SELECT S.id, (SELECT MIN(M.id) FROM main.settings M WHERE M.fingerprint = S.fingerprint)
+                FROM src.settings S
+            ''')
+            cursor.execute("SELECT COUNT(*) FROM src.settings")
+            duplicates = cursor.fetchone()[0] - added
+
+            # calculation_files の行を追加する設定 (まとめ先にまだ NPY がない設定) の旧 ID -> 新 ID
+            #   重複した設定でも NPY がなければ追加するので、新しい設定に限らず NPY ファイルをコピーする
+            cursor.execute('''
+                SELECT I.old_id, I.new_id
+                FROM src.calculation_files C JOIN temp.id_map I ON I.old_id = C.setting_id
+                WHERE NOT EXISTS (SELECT 1 FROM main.calculation_files M WHERE M.setting_id = I.new_id)
+                ORDER BY C.rowid
+            ''')
+            calculation_ids = cursor.fetchall()
+
+            # setting_id を付け替えて各テーブルの行をまとめてコピー (既にある行は残す)
+            for table in SETTING_TABLES:
+                names = [column for column in common_columns(cursor, table) if column != "setting_id"]
+                values = ", ".join(f"T.{column}" for column in names)
+                if table == "calculation_files":
+                    # NPY ファイルは新しい setting_id の名前でコピーする
+                    values = values.replace("T.path", f"'{CALCULATIONS_DIR}/' || I.new_id || '.npy'")
+                    values = values.replace("T.labels_path", f"'{CALCULATIONS_DIR}/' || I.new_id || '_labels.npy'")
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO main.{table} (setting_id, {", ".join(names)})
+                    SELECT I.new_id, {values}
+                    FROM src.{table} T JOIN temp.id_map I ON I.old_id = T.setting_id
+                    ORDER BY T.rowid
+                ''')
+
+            # calculation_files に追加した行の NPY ファイルをコピー
+            copy_calculations(calculation_ids, source_path, conn_path(cursor))
+    finally:
+        cursor.execute("DETACH DATABASE src")
+
+    return added, duplicates
+
+# 接続している main の DB のパス
+def conn_path(cursor):
+    cursor.execute("PRAGMA database_list")
+    return next(row[2] for row in cursor.fetchall() if row[1] == "main")
+
+# NPY ファイルを旧 ID の名前から新 ID の名前にコピーする関数
+#   (ハードリンクにすると、まとめ先で取り込み直したときに取り込んだ DB の NPY まで変わるので、常にコピーする)
+def copy_calculations(id_pairs, source_path, target_path):
+    source_dir = os.path.join(os.path.dirname(os.path.abspath(source_path)), CALCULATIONS_DIR)
+    target_dir = os.path.join(os.path.dirname(os.path.abspath(target_path)), CALCULATIONS_DIR)
+    for old_id, new_id in id_pairs:
+        for suffix in (".npy", "_labels.npy"):
+            source_file = os.path.join(source_dir, f"{old_id}{suffix}")
+            target_file = os.path.join(target_dir, f"{new_id}{suffix}")
+            if not os.path.exists(source_file) or os.path.exists(target_file):
+                continue
+            os.makedirs(target_dir, exist_ok=True)
+            shutil.copyfile(source_file, target_file)
+
+# 使い方: python3 ./PYN/dbmerge.py settings.db JPY/settings.db shift2/settings.db ...
+def main():
+    parser = argparse.ArgumentParser(description="複数の settings.db を 1 つにまとめる")
+    parser.add_argument("target", help="まとめ先の DB (なければ作る)")
+    parser.add_argument("sources", nargs="+", help="取り込む DB")
+    args = parser.parse_args()
+
+    conn = dbconn.connect(args.target)
+    with conn:
+        schema.migrate(conn.cursor())
+
+    for source_path in args.sources:
+        if os.path.abspath(source_path) == os.path.abspath(args.target):
+            continue
+        added, duplicates = merge_database(conn, source_path)
+        print(f"{source_path}: {added} 個の設定を追加しました (重複: {duplicates} 個)")
+
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,262 +1,427 @@
 import os
 import re
-import sqlite3
+import glob
+import argparse
 import hashlib
+import json
 import math
 import shutil
+import tempfile
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
-# 汎用的な変数抽出関数
-def extract_variable(content, start_pattern, value_pattern, group_indices, var_names):
-    in_block = False
-    extracted_values = {}
+import numpy as np
+
+import dbconn
+import nuclide
+import schema
+
+# 解析処理のバージョン (抽出内容を変えたら上げる。lpp_files のキャッシュが無効になる)
+PARSER_VERSION = 5
+
+# LISE++ から書き出した LPP ファイル (引数なしで取り込むファイル)
+#   このファイルを取り込んだときだけ ./LPP/BigRIPS_No{setting_id:02d}_136Xe_{Symbol}.lpp にコピーを残す
+TEMP_LPP = "./LPP/temp.lpp"
+
+# 計算セクションの開始を示す行
+CALCULATIONS_MARKER = '{============================= Calculations ======================================}'
+
+# [Calculations] を一度に配列へ変換する行数 (メモリ使用量はこの行数で頭打ちになる)
+CHUNK_ROWS = 4096
+
+# [Calculations] の全数値を保存するディレクトリ (データベースと同じ場所の NPY/)
+#   NPY/{setting_id}.npy        : 全行 × 全列の float32 配列 (np.load(..., mmap_mode='r') で読める)
+#   NPY/{setting_id}_labels.npy : 各行の核種名と荷電状態
+CALCULATIONS_DIR = "NPY"
+CALCULATIONS_DTYPE = np.dtype('<f4')
+
+# LPP ファイルを 1 回だけ走査し、セクションごとの {key: value} 索引を作る関数
+#   sections : {"settings": {"Intensity": "5 pnA", ...}, "D1_DipoleSettings": {...}, ...}
+#   blocks   : {"F1 Wedge": {"contents1": ..., "thickness": ..., "Angle": ...}, ...}
+#              (Name = 〜 で名前の付いたブロックの全セクションをまとめたもの)
+# 計算セクションの開始行まで読んだところで止まるので、続きは iter_calculation_chunks() で読む
+def index_lpp(content):
+    sections = {}
+    blocks = {}
+    block_of_prefix = {}
+    current = None
+
+    for line in content:
+        # 計算セクションの開始を検出
+        if CALCULATIONS_MARKER in line:
+            break
+
+        stripped = line.strip()
+
+        # セクションの開始を検出
+        if stripped.startswith('[') and stripped.endswith(']'):
+            current = stripped[1:-1]
+            sections.setdefault(current, {})
+            continue
+
+        if current is None or '=' not in stripped:
+            continue
 
+        # key = value ; comment
+        key, value = stripped.split('=', 1)
+        key = key.strip()
+        value = value.split(';', 1)[0].strip()
+        sections[current].setdefault(key, value)
+
+        # "S3_General" などの Name からブロック名 -> ブロック接頭辞 (S3) を登録
+        prefix = current.split('_', 1)[0]
+        if key == 'Name' and current.endswith('_General'):
+            name = value.rsplit(',', 1)[0].strip()
+            if name not in blocks:
+                blocks[name] = {}
+                block_of_prefix[prefix] = name
+
+        # 名前付きブロックの全セクションの値をまとめる (最初に現れた値を優先)
+        if prefix in block_of_prefix:
+            blocks[block_of_prefix[prefix]].setdefault(key, value)
+
+    return sections, blocks
+
+# [Calculations] ブロック全体を一括で配列に変換する関数
+#   names   : 核種名のリスト (例: '119Cd')
+#   charges : 各ダイポールでの荷電状態 (行数 × 8 の整数配列)
+#   values  : 各行の数値 (行数 × 426 の float 配列)
+def decode_calculations(labels, rows):
+    if not rows:
+        return [], np.zeros((0, 0), dtype=np.int16), np.zeros((0, 0))
+
+    # 数値部分は全行をつなげて 1 回で float に変換
+    values = np.array(','.join(rows).split(','), dtype=np.float64).reshape(len(rows), -1)
+
+    # "119Cd 48+ 47+ ..." を (行数 × 9) の表にして、荷電状態を整数に変換
+    tokens = np.array(' '.join(labels).split()).reshape(len(labels), -1)
+    names = tokens[:, 0].tolist()
+    charges = np.char.rstrip(tokens[:, 1:], '+').astype(np.int16)
+
+    return names, charges, values
+
+# [Calculations] の行を CHUNK_ROWS 行ずつ配列に変換して返すジェネレータ
+#   content は計算セクションの開始行より後ろを指しているファイル (index_lpp() の後など)
+#   prefixes (nuclide_prefixes() の戻り値) を渡すと、行頭が一致しない行は分割も数値変換もせずに読み飛ばす
+def iter_calculation_chunks(content, chunk_rows=CHUNK_ROWS, prefixes=None):
+    labels = []
+    rows = []
     for line in content:
-        # ブロックの開始を確認
-        if re.search(start_pattern, line):
-            in_block = True
+        if prefixes is not None and not line.startswith(prefixes):
             continue
-        
-        # ブロック内の変数抽出
-        if in_block:
-            match = re.search(value_pattern, line)
-            if match:
-                for i, var_name in enumerate(var_names):
-                    extracted_values[var_name] = match.group(group_indices[i])
-                break  # 変数が見つかったら終了
+        # '=' が含まれる行から情報を抽出
+        if '=' not in line or '[Calculations]' in line:
+            continue
+        label, numbers = line.split('=', 1)  # '=' で分割
+        labels.append(label)
+        rows.append(numbers.strip())
+
+        if len(rows) >= chunk_rows:
+            yield decode_calculations(labels, rows)
+            labels = []
+            rows = []
+
+    if rows:
+        yield decode_calculations(labels, rows)
+
+# [Calculations] の行を 1 行ずつ (核種名, 荷電状態, 数値) で返すジェネレータ
+#   ファイル全体を読み込まないので、ブロックがどれだけ長くてもメモリ使用量は一定
+#   nuclides (核種名のリスト) や z_range / n_range ((最小, 最大)) を指定すると、その核種の行だけを返す
+#   例: iter_calculations(path, nuclides=["99Zr", "100Zr"]), iter_calculations(path, z_range=(39, 41), n_range=(58, 62))
+def iter_calculations(file_path, chunk_rows=CHUNK_ROWS, nuclides=None, z_range=None, n_range=None):
+    prefixes = nuclide_prefixes(nuclides, z_range, n_range)
+    with open(file_path, 'r', buffering=1 << 20) as file:
+        for line in file:
+            if CALCULATIONS_MARKER in line:
+                break
+
+        for names, charges, values in iter_calculation_chunks(file, chunk_rows, prefixes):
+            for i, name in enumerate(names):
+                yield name, charges[i], values[i]
+
+# 核種の指定から、[Calculations] の行頭 ("99Zr 40+ ...") と比べる接頭辞のタプルを作る関数
+#   核種名のリストと Z / N の範囲の両方を指定した場合は、リストのうち範囲に入る核種だけ
+#   何も指定しない場合は None (全行を読む)
+def nuclide_prefixes(nuclides=None, z_range=None, n_range=None):
+    if nuclides is None and z_range is None and n_range is None:
+        return None
+
+    z_min, z_max = z_range if z_range is not None else (1, nuclide.MAX_Z)
+    n_min, n_max = n_range if n_range is not None else (0, MAX_NEUTRON_NUMBER)
+
+    if nuclides is None:
+        ids = [nuclide.nuclide_id(Z + N, Z) for Z in range(max(z_min, 1), min(z_max, nuclide.MAX_Z) + 1)
+               for N in range(n_min, n_max + 1)]
+    else:
+        ids = [nid for nid in map(nuclide.name_to_id, nuclides) if nid is not None]
+
+    prefixes = []
+    for nid in ids:
+        if z_min <= nuclide.Z_of(nid) <= z_max and n_min <= nuclide.N_of(nid) <= n_max:
+            # 空白まで含めて比べるので "99Zr" が "99Zn" や "199..." に一致することはない
+            prefixes.append(nuclide.id_to_name(nid) + " ")
+    return tuple(prefixes)
+
+# Z / N の範囲で N の上限を指定しなかったときに探す中性子数の上限
+MAX_NEUTRON_NUMBER = 200
+
+# ===== [Calculations] の列の意味 ================================================================
+# 先頭の HEADER_COLUMNS 列は全体の量、その後に BlockStructure の順で Available = 1 のブロックが
+# 種類ごとに決まった列数ずつ並ぶ (D: Dipole, S: Drift/Slit, M: Material, W: Wedge, A: FaradayCup)
+HEADER_COLUMNS = 26
+BLOCK_WIDTHS = {"D": 5, "S": 5, "M": 8, "W": 8, "A": 2}
+
+# 意味の分かっている列 (それ以外の列は "#列番号" という名前にする)
+HEADER_QUANTITIES = {0: "Yield", 4: "x_section", 6: "Transmission"}
+BLOCK_QUANTITIES = {
+    "S": {0: "Transmission"},
+    "M": {0: "Unreacted", 6: "Qratio"},
+    "W": {0: "Unreacted", 6: "Qratio"},
+}
+
+# レイアウトのハッシュ -> 列の対応表 (同じビームラインの設定では 1 回だけ作る)
+column_map_cache = {}
+
+# BlockStructure と各ブロックの Name / Available から、このファイルのレイアウトを求める関数
+#   [(ブロックの接頭辞, ブロック名, ブロックの種類), ...] (Available = 1 のブロックだけ)
+def block_layout(sections):
+    block_structure = sections.get("general", {}).get("BlockStructure", "")
+    layout = []
+    counts = {}
+    for block_type in block_structure:
+        counts[block_type] = counts.get(block_type, 0) + 1
+        prefix = f"{block_type}{counts[block_type]}"
+        general = sections.get(f"{prefix}_General", {})
+        if general.get("Available", "1").strip() != "1":
+            continue
+        name = general.get("Name", prefix).rsplit(",", 1)[0].strip()
+        layout.append((prefix, name, block_type))
+    return layout
+
+# レイアウトから列の対応表を作る関数 (レイアウトのハッシュでキャッシュする)
+#   columns : [(ブロック名, ブロックの種類, 量), ...]  (列番号の順)
+#   index   : {(ブロック名, 量): 列番号}  (同じ名前のブロックがあれば最初のもの)
+def column_map(sections):
+    layout = block_layout(sections)
+    layout_hash = hashlib.sha1(repr(layout).encode()).hexdigest()
+    if layout_hash in column_map_cache:
+        return column_map_cache[layout_hash]
+
+    columns = [("Total", "-", HEADER_QUANTITIES.get(k, f"#{k}")) for k in range(HEADER_COLUMNS)]
+    for prefix, name, block_type in layout:
+        if block_type not in BLOCK_WIDTHS:
+            raise ValueError(f"未知のブロックの種類です: {block_type} ({prefix} {name})")
+        quantities = BLOCK_QUANTITIES.get(block_type, {})
+        for k in range(BLOCK_WIDTHS[block_type]):
+            columns.append((name, block_type, quantities.get(k, f"#{k}")))
+
+    index = {}
+    for i, (name, block_type, quantity) in enumerate(columns):
+        index.setdefault((name, quantity), i)
+
+    result = {"layout_hash": layout_hash, "n_cols": len(columns), "columns": columns, "index": index}
+    column_map_cache[layout_hash] = result
+    return result
+
+# 列の対応表から (ブロック名, 量) の列番号を引く関数
+def column_index(columns, block_name, quantity):
+    key = (block_name, quantity)
+    if key not in columns["index"]:
+        raise KeyError(f"[Calculations] に {block_name} の {quantity} の列がありません")
+    return columns["index"][key]
+
+# チャンクを流しながら、全行の数値を float32 で一時ファイルに書き出すジェネレータ
+#   spool にはあとで NPY/ に移すための情報 (一時ファイル, 行数, 列数, 核種名, 荷電状態, 収量) が入る
+#   一時ファイルは spool_dir (None ならシステムの一時ディレクトリ) に作る
+def spool_calculation_chunks(chunks, spool, spool_dir=None):
+    with tempfile.NamedTemporaryFile(suffix='.f4', delete=False, dir=spool_dir) as tmp:
+        spool.update(path=tmp.name, n_rows=0, n_cols=0, names=[], charges=[], yields=[])
+        for names, charges, values in chunks:
+            values.astype(CALCULATIONS_DTYPE).tofile(tmp)
+            spool['n_rows'] += values.shape[0]
+            spool['n_cols'] = values.shape[1]
+            spool['names'].extend(names)
+            spool['charges'].append(charges)
+            spool['yields'].append(values[:, 0].copy())
+            yield names, charges, values
+
+# 汎用的な変数抽出関数 (索引から O(1) で値を取り出し、値の文字列にだけ正規表現を適用)
+def extract_variable(entries, key, value_pattern, group_indices, var_names):
+    extracted_values = {}
+
+    value = entries.get(key)
+    if value is None:
+        return extracted_values
+
+    match = re.search(value_pattern, value)
+    if match:
+        for i, var_name in enumerate(var_names):
+            extracted_values[var_name] = match.group(group_indices[i])
 
     return extracted_values
 
 # ファイルの内容を読み込む関数
-def extract_data_from_file(file_path):
-    with open(file_path, 'r') as file:
-        content = file.readlines()
+def extract_data_from_file(file_path, spool_dir=None):
+    with open(file_path, 'r', buffering=1 << 20) as file:
+        sections, blocks = index_lpp(file)
+
+        # ===== Statistics of Nuclide ===================================================================
+        # ブロック構成から列の対応表を作り、保存する量の列番号を名前で引く
+        columns = column_map(sections)
+        isotope_indices = [column_index(columns, block_name, quantity) for block_name, quantity in isotope_columns.values()]
+
+        # 索引を作った続きから [Calculations] を流し読みし、全行を一時ファイルに書き出しつつ保存候補の行だけを残す
+        spool = {}
+        isotopes = select_isotopes(spool_calculation_chunks(iter_calculation_chunks(file), spool, spool_dir),
+                                   isotope_indices, columns["n_cols"])
 
     # 結果を格納する辞書
     extracted_data = {}
-    numbers = []
-    Isotope = []
-    in_calculations_section = False
 
     # 各種変数を抽出
     # ===== Settings ================================================================================
     # === Mechanism of PF ===
+    convolution = sections.get("convolution", {})
     extracted_data["Model"] = extract_variable(
-        content, 
-        r"\[convolution\]",                  # ブロックの開始パターン
-        r"Convolution mode = ([+-]?[\d.]+)", # 値のパターン
+        convolution,
+        "Convolution mode",                  # キー
+        r"([+-]?[\d.]+)",                    # 値のパターン
         [1],                                 # 抽出したいグループのインデックス（数字とシンボル）
-        ["Model"]            # 対応する変数名
+        ["Model"]                            # 対応する変数名
     )
 
     extracted_data["Coeff"] = extract_variable(
-        content, 
-        r"\[convolution\]",                  # ブロックの開始パターン
-        r"CoefConv_1 = ([+-]?[\d.]+)",       # 値のパターン
+        convolution,
+        "CoefConv_1",                        # キー
+        r"([+-]?[\d.]+)",                    # 値のパターン
         [1],                                 # 抽出したいグループのインデックス（数字とシンボル）
-        ["Coeff"]            # 対応する変数名
+        ["Coeff"]                            # 対応する変数名
     )
 
     # === Primary Beam ===
+    settings_section = sections.get("settings", {})
     extracted_data["Primary Beam"] = extract_variable(
-        content, 
-        r"\[settings\]",              # ブロックの開始パターン
-        r"A,Z,Q = (\d+)([A-Za-z]+)",  # 値のパターン
-        [1, 2],                          # 抽出したいグループのインデックス（数字とシンボル）
+        settings_section,
+        "A,Z,Q",                      # キー
+        r"(\d+)([A-Za-z]+)",          # 値のパターン
+        [1, 2],                       # 抽出したいグループのインデックス（数字とシンボル）
         ["Mass", "Symbol"]            # 対応する変数名
     )
 
     # === Intensity ===
     extracted_data["Intensity"] = extract_variable(
-        content, 
-        r"\[settings\]",              # ブロックの開始パターン
-        r"Intensity = ([\d.]+)",  # 値のパターン
+        settings_section,
+        "Intensity",                  # キー
+        r"([\d.]+)",                  # 値のパターン
         [1],                          # 抽出したいグループのインデックス（数字とシンボル）
-        ["Intensity"]            # 対応する変数名
+        ["Intensity"]                 # 対応する変数名
     )
 
     # === Centered Nuclide ===
     extracted_data["Centered Nuclide"] = extract_variable(
-        content, 
-        r"\[settings\]",              # ブロックの開始パターン
-        r"Settings on A,Z = (\d+)([A-Za-z]+)",  # 値のパターン
-        [1, 2],                          # 抽出したいグループのインデックス（数字とシンボル）
+        settings_section,
+        "Settings on A,Z",            # キー
+        r"(\d+)([A-Za-z]+)",          # 値のパターン
+        [1, 2],                       # 抽出したいグループのインデックス（数字とシンボル）
         ["Mass", "Symbol"]            # 対応する変数名
     )
 
     # ===== Beam-line materials =====================================================================
     # === F0 Be ===
+    target = sections.get("target", {})
     # = Atomic Number and Mass
     extracted_data["Target_Z_Mass"] = extract_variable(
-        content, 
-        r"\[target\]",              # ブロックの開始パターン
-        r"Target contents = ([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)",  # 値のパターン
-        [2, 4],                          # 抽出したいグループのインデックス
-        ["Z", "Mass"]                    # 対応する変数名
+        target,
+        "Target contents",                                                  # キー
+        r"([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)",         # 値のパターン
+        [2, 4],                                                             # 抽出したいグループのインデックス
+        ["Z", "Mass"]                                                       # 対応する変数名
     )
 
     # = Thickness
     extracted_data["Target_thickness"] = extract_variable(
-        content, 
-        r"\[target\]", 
-        r"Target thickness = ([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)", 
-        [2], 
+        target,
+        "Target thickness",
+        r"([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)",
+        [2],
         ["thickness"]
     )
 
     # === F1/5 deg ===
     for wedge in ["F1", "F5"]:
+        wedge_block = blocks.get(f"{wedge} Wedge", {})
+
         # = Atomic Number and Mass
         extracted_data[f"{wedge}_Wedge_Z_Mass"] = extract_variable(
-            content, 
-            rf"Name = {wedge} Wedge", 
-            r"contents1 = ([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)", 
-            [2, 4], 
+            wedge_block,
+            "contents1",
+            r"([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)",
+            [2, 4],
             ["Z", "Mass"]
         )
 
         # = Thickness
         extracted_data[f"{wedge}_Wedge_thickness"] = extract_variable(
-            content, 
-            rf"Name = {wedge} Wedge", 
-            r"thickness = ([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)", 
-            [2], 
+            wedge_block,
+            "thickness",
+            r"([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)",
+            [2],
             ["Thickness"]
         )
 
         # = Angle
         extracted_data[f"{wedge}_Wedge_Angle"] = extract_variable(
-            content, 
-            rf"Name = {wedge} Wedge", 
-            r"Angle = ([+-]?[\d.]+)", 
-            [1], 
+            wedge_block,
+            "Angle",
+            r"([+-]?[\d.]+)",
+            [1],
             ["Angle"]
         )
 
     # ===== Brho (Tm) ===============================================================================
     for i in range(1, 9):
         extracted_data[f"D{i}_Brho"] = extract_variable(
-            content, 
-            rf"\[D{i}_DipoleSettings\]", 
-            r"Brho = ([+-]?[\d.]+)\s+Tm", 
-            [1], 
+            sections.get(f"D{i}_DipoleSettings", {}),
+            "Brho",
+            r"([+-]?[\d.]+)\s+Tm",
+            [1],
             ["Brho"]
         )
 
     # ===== Slit (mm) ===============================================================================
+    slit_pattern = r"([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)"
+
     # === Beamdump ===
     extracted_data["ExitBeamDump_x_width"] = extract_variable(
-        content, 
-        r"Name = ExitBeamDump", 
-        r"X_size = ([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)", 
-        [2, 4], 
+        blocks.get("ExitBeamDump", {}),
+        "X_size",
+        slit_pattern,
+        [2, 4],
         ["Left", "Right"]
     )
 
     # === Focal Planes (X) ===
     for slit in ["F1", "F2", "F2.5", "F5", "F7"]:
         extracted_data[f"{slit}_slit_x_width"] = extract_variable(
-            content, 
-            rf"Name = {slit} slit", 
-            r"X_size = ([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)", 
-            [2, 4], 
+            blocks.get(f"{slit} slit", {}),
+            "X_size",
+            slit_pattern,
+            [2, 4],
             ["Left", "Right"]
         )
 
     # === Focal Planes (Y) ===
     for slit in ["F2.5"]:
         extracted_data[f"{slit}_slit_y_width"] = extract_variable(
-            content, 
-            rf"Name = {slit} slit", 
-            r"Y_size = ([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+),([+-]?[\d.]+)", 
-            [2, 4], 
+            blocks.get(f"{slit} slit", {}),
+            "Y_size",
+            slit_pattern,
+            [2, 4],
             ["Left", "Right"]
         )
 
-    # ===== Statistics of Nuclide ===================================================================
-    with open(file_path, 'r') as file:
-        for line in file:
-            
-            # 計算セクションの開始を検出
-            if '{============================= Calculations ======================================}' in line:
-                in_calculations_section = True
-                continue  # 次の行に進む
-            
-            # 計算セクションが開始された後、[Calculations]を探す
-            if in_calculations_section:
-                if '[Calculations]' in line:
-                    continue  # 次の行に進む
-                
-                # '=' が含まれる行から情報を抽出
-                if '=' in line:
-                    parts = line.split('=')  # '=' で分割
-                    isotope_name = parts[0].strip()  # 名前部分を取得
-                    numbers_part = parts[1].strip()  # 数値部分を取得
-                    
-                    # 数値部分をカンマで分割
-                    number_strings = numbers_part.split(',')
-                    numbers = [num.strip() for num in number_strings]  # スペースを削除してリスト化
-
-                    # Isotope配列にデータを格納
-                    # 例えば、isotope_name = '106Nb' の場合
-                    Isotope.append([isotope_name] + numbers)  # 名前と数値を連結して追加
-
-    return extracted_data, Isotope
-
-# ファイルパスを指定
-file_path = "./LPP/temp.lpp"
-
-# 抽出結果を取得
-data, Isotope = extract_data_from_file(file_path)
-
-print(data)
-
-# 原子番号を元素記号から取得する辞書
-element_dict = {
-    "H": 1, "He": 2, "Li": 3, "Be": 4, "B": 5, "C": 6,
-    "N": 7, "O": 8, "F": 9, "Ne": 10, "Na": 11, "Mg": 12,
-    "Al": 13, "Si": 14, "P": 15, "S": 16, "Cl": 17, "Ar": 18,
-    "K": 19, "Ca": 20, "Sc": 21, "Ti": 22, "V": 23, "Cr": 24,
-    "Mn": 25, "Fe": 26, "Co": 27, "Ni": 28, "Cu": 29, "Zn": 30,
-    "Ga": 31, "Ge": 32, "As": 33, "Se": 34, "Br": 35, "Kr": 36,
-    "Rb": 37, "Sr": 38, "Y": 39, "Zr": 40, "Nb": 41, "Mo": 42,
-    "Tc": 43, "Ru": 44, "Rh": 45, "Pd": 46, "Ag": 47, "Cd": 48,
-    "In": 49, "Sn": 50, "Sb": 51, "Te": 52, "I": 53, "Xe": 54,
-    "Cs": 55, "Ba": 56, "La": 57, "Ce": 58, "Pr": 59, "Nd": 60,
-    "Pm": 61, "Sm": 62, "Eu": 63, "Gd": 64, "Tb": 65, "Dy": 66,
-    "Ho": 67, "Er": 68, "Tm": 69, "Yb": 70, "Lu": 71, "Hf": 72,
-    "Ta": 73, "W": 74, "Re": 75, "Os": 76, "Ir": 77, "Pt": 78,
-    "Au": 79, "Hg": 80, "Tl": 81, "Pb": 82, "Bi": 83, "Po": 84,
-    "At": 85, "Rn": 86, "Fr": 87, "Ra": 88, "Ac": 89, "Th": 90,
-    "Pa": 91, "U": 92, "Np": 93, "Pu": 94, "Am": 95, "Cm": 96,
-    "Bk": 97, "Cf": 98, "Es": 99, "Fm": 100, "Md": 101, "No": 102,
-    "Lr": 103, "Rf": 104, "Db": 105, "Sg": 106, "Bh": 107, "Hs": 108,
-    "Mt": 109, "Ds": 110, "Rg": 111, "Cn": 112, "Nh": 113, "Fl": 114,
-    "Mc": 115, "Lv": 116, "Ts": 117, "Og": 118
-}
+    return extracted_data, sections, isotopes, spool
 
-# Mechanism of PF
-Model = data["Model"]["Model"]
-Coeff = data["Coeff"]["Coeff"]
-
-# Primary Beam
-Nuclide   = data["Primary Beam"]["Mass"] + data["Primary Beam"]["Symbol"]
-Intensity = data["Intensity"]["Intensity"]
-
-# Nuclide on central orbit
-Symbol = data["Centered Nuclide"]["Mass"] + data["Centered Nuclide"]["Symbol"]
-A      = float(data["Centered Nuclide"]["Mass"]  )         
-symbol = data["Centered Nuclide"]["Symbol"]
-Z      = float(element_dict.get(symbol, None)    )      
-N      = A - Z      
-
-# Beam-line materials
-F0Be  = data["Target_thickness"]  ["thickness"]
-F1t   = data["F1_Wedge_thickness"]["Thickness"]
-F1a   = data["F1_Wedge_Angle"]    ["Angle"]
-F5Mat = "C"
-F5t   = data["F5_Wedge_thickness"]["Thickness"]
-F5a   = data["F5_Wedge_Angle"]    ["Angle"]
 
 # エネルギーを計算する関数
 def calculate_energy(Mass, Z, Brho):
@@ -264,279 +429,533 @@ def calculate_energy(Mass, Z, Brho):
     energy = 931.494 * (math.sqrt(1 + (299.8 * Z * Brho / (Mass * 931.494))**2) - 1)
     return energy
 
-# settingsを定義
-settings = {}
-
-# 変数をsettingsに詰め込む
-settings["Model"] = Model
-settings["Coeff"] = Coeff
-settings["Nuclide"] = Nuclide
-settings["Intensity"] = Intensity
-settings["Symbol"] = Symbol
-settings["A"] = A
-settings["Z"] = Z
-settings["N"] = N
-settings["F0Be"] = F0Be
-settings["F1t"] = F1t
-settings["F1a"] = F1a
-settings["F5Mat"] = F5Mat
-settings["F5t"] = F5t
-settings["F5a"] = F5a
-
-# D1からD8までのBrhoをsettingsに追加
-for i in range(1, 9):
-    brho_key = f"D{i}_Brho"
-    settings[brho_key] = float(data[brho_key]["Brho"])
-
-# エネルギー計算を行い、結果をsettingsに追加
-for i in range(1, 9):
-    brho_value = settings[f"D{i}_Brho"]
-    energy = calculate_energy(A, Z, brho_value)  # 例としてAとZを使用
-    settings[f"D{i}_Energy"] = energy
-
-settings["DumpL"]  = data["ExitBeamDump_x_width"]["Left"]
-settings["DumpR"]  = data["ExitBeamDump_x_width"]["Right"]
-settings["F1L"]    = data["F1_slit_x_width"]     ["Left"]
-settings["F1R"]    = data["F1_slit_x_width"]     ["Right"]
-settings["F2L"]    = data["F2_slit_x_width"]     ["Left"]
-settings["F2R"]    = data["F2_slit_x_width"]     ["Right"]
-settings["F2.5XL"] = data["F2.5_slit_x_width"]   ["Left"]
-settings["F2.5XR"] = data["F2.5_slit_x_width"]   ["Right"]
-settings["F2.5YL"] = data["F2.5_slit_y_width"]   ["Left"]
-settings["F2.5YR"] = data["F2.5_slit_y_width"]   ["Right"]
-settings["F5L"]    = data["F5_slit_x_width"]     ["Left"]
-settings["F5R"]    = data["F5_slit_x_width"]     ["Right"]
-settings["F7L"]    = data["F7_slit_x_width"]     ["Left"]
-settings["F7R"]    = data["F7_slit_x_width"]     ["Right"]
-
-# 結果を表示
-print(settings)
-
-# SQLiteデータベースの接続
-conn = sqlite3.connect('settings.db')
-cursor = conn.cursor()
-
-# 設定テーブルの作成
-cursor.execute('''CREATE TABLE IF NOT EXISTS settings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    hash TEXT UNIQUE,
-                    Model TEXT,
-                    Coeff REAL,
-                    Nuclide TEXT,
-                    Intensity REAL,
-                    Symbol TEXT,
-                    A INTEGER,
-                    Z INTEGER,
-                    N INTEGER,
-                    F0Be REAL,
-                    F1t REAL,
-                    F1a REAL,
-                    F5Mat REAL,
-                    F5t REAL,
-                    F5a REAL,
-                    D1_Brho REAL,
-                    D2_Brho REAL,
-                    D3_Brho REAL,
-                    D4_Brho REAL,
-                    D5_Brho REAL,
-                    D6_Brho REAL,
-                    D7_Brho REAL,
-                    D8_Brho REAL,
-                    D1_Energy REAL,
-                    D2_Energy REAL,
-                    D3_Energy REAL,
-                    D4_Energy REAL,
-                    D5_Energy REAL,
-                    D6_Energy REAL,
-                    D7_Energy REAL,
-                    D8_Energy REAL,
-                    DumpL REAL,
-                    DumpR REAL,
-                    F1L REAL, 
-                    F1R REAL, 
-                    F2L REAL, 
-                    F2R REAL, 
-                    F25XL REAL,
-                    F25XR REAL,
-                    F25YL REAL,
-                    F25YR REAL,
-                    F5L REAL, 
-                    F5R REAL, 
-                    F7L REAL, 
-                    F7R REAL 
-                )''')
-
-# 設定のハッシュを計算（辞書の内容を文字列化してからハッシュ化）
-settings_str = ''.join(f"{k}:{v}" for k, v in settings.items())
-settings_hash = hashlib.sha256(settings_str.encode()).hexdigest()
-
-# 既存の設定かどうか確認
-cursor.execute("SELECT id FROM settings WHERE hash = ?", (settings_hash,))
-result = cursor.fetchone()
-
-if result is None:
-    # 設定が存在しない場合、新しい設定として保存
-    cursor.execute('''INSERT INTO settings (hash, Model, Coeff, Nuclide, Intensity, Symbol, A, Z, N, F0Be, F1t, F1a, F5Mat, F5t, F5a,
-                                            D1_Brho, D2_Brho, D3_Brho, D4_Brho, D5_Brho, D6_Brho, D7_Brho, D8_Brho,
-                                            D1_Energy, D2_Energy, D3_Energy, D4_Energy, D5_Energy, D6_Energy, D7_Energy, D8_Energy,
-                                            DumpL, DumpR, F1L, F1R, F2L, F2R, F25XL, F25XR, F25YL, F25YR, F5L, F5R, F7L, F7R
-                                            )
-                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
-                   (settings_hash, settings["Model"], settings["Coeff"], settings["Nuclide"], settings["Intensity"], 
-                    settings["Symbol"], settings["A"], settings["Z"], settings["N"], settings["F0Be"], 
-                    settings["F1t"], settings["F1a"], settings["F5Mat"], settings["F5t"], settings["F5a"], 
-                    settings["D1_Brho"], settings["D2_Brho"], settings["D3_Brho"], settings["D4_Brho"], 
-                    settings["D5_Brho"], settings["D6_Brho"], settings["D7_Brho"], settings["D8_Brho"],
-                    settings["D1_Energy"], settings["D2_Energy"], settings["D3_Energy"], settings["D4_Energy"],
-                    settings["D5_Energy"], settings["D6_Energy"], settings["D7_Energy"], settings["D8_Energy"],
-                    settings["DumpL"], settings["DumpR"], settings["F1L"], settings["F1R"], settings["F2L"], settings["F2R"],
-                    settings["F2.5XL"], settings["F2.5XR"], settings["F2.5YL"], settings["F2.5YR"], 
-                    settings["F5L"], settings["F5R"], settings["F7L"], settings["F7R"]))
-    conn.commit()
-    setting_id = cursor.lastrowid  # 新しいIDを取得
-else:
-    # 既存の設定がある場合、そのIDを取得
-    setting_id = result[0]
-
-# ファイルを指定されたディレクトリに保存
-#output_dir = f"./LPP/BigRIPS_No{setting_id:02d}_136Xe_{settings['Symbol']}"
-#os.makedirs(output_dir, exist_ok=True)
-#output_file_path = os.path.join(output_dir, f"{setting_id}.lpp")
-output_file_path=f"./LPP/BigRIPS_No{setting_id:02d}_136Xe_{settings['Symbol']}.lpp"
-
-# temp.lppを新しい場所にコピー
-shutil.copy("./LPP/temp.lpp", output_file_path)
-
-print(f"ファイルを {output_file_path} に保存しました。ID: {setting_id}")
-
-# データベースを閉じる
-conn.close()
+# 抽出結果から settings を組み立てる関数 (数値の項目はここで float に変換する)
+def build_settings(data):
+    # Mechanism of PF
+    Model = data["Model"]["Model"]
+    Coeff = float(data["Coeff"]["Coeff"])
+
+    # Primary Beam
+    Nuclide   = data["Primary Beam"]["Mass"] + data["Primary Beam"]["Symbol"]
+    Intensity = float(data["Intensity"]["Intensity"])
+
+    # Nuclide on central orbit
+    Symbol = data["Centered Nuclide"]["Mass"] + data["Centered Nuclide"]["Symbol"]
+    A      = float(data["Centered Nuclide"]["Mass"]  )
+    symbol = data["Centered Nuclide"]["Symbol"]
+    Z      = float(nuclide.element_dict.get(symbol, None))
+    N      = A - Z
+
+    # Beam-line materials
+    F0Be  = float(data["Target_thickness"]  ["thickness"])
+    F1t   = float(data["F1_Wedge_thickness"]["Thickness"])
+    F1a   = float(data["F1_Wedge_Angle"]    ["Angle"])
+    F5Mat = "C"
+    F5t   = float(data["F5_Wedge_thickness"]["Thickness"])
+    F5a   = float(data["F5_Wedge_Angle"]    ["Angle"])
+
+    # settingsを定義
+    settings = {}
+
+    # 変数をsettingsに詰め込む
+    settings["Model"] = Model
+    settings["Coeff"] = Coeff
+    settings["Nuclide"] = Nuclide
+    settings["Intensity"] = Intensity
+    settings["Symbol"] = Symbol
+    settings["A"] = A
+    settings["Z"] = Z
+    settings["N"] = N
+    settings["F0Be"] = F0Be
+    settings["F1t"] = F1t
+    settings["F1a"] = F1a
+    settings["F5Mat"] = F5Mat
+    settings["F5t"] = F5t
+    settings["F5a"] = F5a
+
+    # D1からD8までのBrhoをsettingsに追加
+    for i in range(1, 9):
+        brho_key = f"D{i}_Brho"
+        settings[brho_key] = float(data[brho_key]["Brho"])
 
-# Ion Production Rate    : 001 番目 (4.13)
-# X-Section in target    : 005 番目 (4.18e-6)
-# Total Ion Transmission : 007 番目 (6.407)
-# Transmission_F1slit    : 042 番目 (33.42)
-# Transmission_F2slit    : 060 番目 (50.18)
-# Transmission_F2.5slit  : 070 番目 (96.73)
-# Transmission_F5slit    : 162 番目 (65.19)
-# Transmission_F7slit    : 233 番目 (81.68)
-# Qratio_F3              : 134 番目 (98.72)
-# Qratio_F5              : 181 番目 (98.17)
-# Unreacted_F5           : 167 番目 (88.71)
+    # エネルギー計算を行い、結果をsettingsに追加
+    for i in range(1, 9):
+        brho_value = settings[f"D{i}_Brho"]
+        energy = calculate_energy(A, Z, brho_value)  # 例としてAとZを使用
+        settings[f"D{i}_Energy"] = energy
+
+    settings["DumpL"]  = float(data["ExitBeamDump_x_width"]["Left"])
+    settings["DumpR"]  = float(data["ExitBeamDump_x_width"]["Right"])
+    settings["F1L"]    = float(data["F1_slit_x_width"]     ["Left"])
+    settings["F1R"]    = float(data["F1_slit_x_width"]     ["Right"])
+    settings["F2L"]    = float(data["F2_slit_x_width"]     ["Left"])
+    settings["F2R"]    = float(data["F2_slit_x_width"]     ["Right"])
+    settings["F2.5XL"] = float(data["F2.5_slit_x_width"]   ["Left"])
+    settings["F2.5XR"] = float(data["F2.5_slit_x_width"]   ["Right"])
+    settings["F2.5YL"] = float(data["F2.5_slit_y_width"]   ["Left"])
+    settings["F2.5YR"] = float(data["F2.5_slit_y_width"]   ["Right"])
+    settings["F5L"]    = float(data["F5_slit_x_width"]     ["Left"])
+    settings["F5R"]    = float(data["F5_slit_x_width"]     ["Right"])
+    settings["F7L"]    = float(data["F7_slit_x_width"]     ["Left"])
+    settings["F7R"]    = float(data["F7_slit_x_width"]     ["Right"])
+
+    return settings
+
+# まったく同じ設定の setting_id を返す関数 (なければ None)
+def find_setting(cursor, settings):
+    cursor.execute("SELECT MIN(id) FROM settings WHERE fingerprint = ?",
+                   (schema.settings_fingerprint(schema.settings_row(settings)),))
+    return cursor.fetchone()[0]
+
+# 粗いキーが同じ (スリット幅などだけが違う) 設定の setting_id のリストを返す関数
+def find_similar_settings(cursor, settings):
+    cursor.execute("SELECT id FROM settings WHERE coarse_key = ? ORDER BY id",
+                   (schema.settings_coarse_key(schema.settings_row(settings)),))
+    return [row[0] for row in cursor.fetchall()]
+
+# settings を保存して setting_id を返す関数 (同じフィンガープリントの設定があればそのIDを返す)
+def insert_settings(cursor, settings):
+    row = schema.settings_row(settings)
+    fingerprint = schema.settings_fingerprint(row)
+
+    # 既存の設定かどうか確認
+    setting_id = find_setting(cursor, settings)
+
+    if setting_id is None:
+        # 設定が存在しない場合、新しい設定として保存
+        cursor.execute('''INSERT INTO settings (fingerprint, coarse_key, hash, Model, Coeff, Nuclide, Intensity, Symbol, A, Z, N, F0Be, F1t, F1a, F5Mat, F5t, F5a,
+                                                D1_Brho, D2_Brho, D3_Brho, D4_Brho, D5_Brho, D6_Brho, D7_Brho, D8_Brho,
+                                                D1_Energy, D2_Energy, D3_Energy, D4_Energy, D5_Energy, D6_Energy, D7_Energy, D8_Energy,
+                                                DumpL, DumpR, F1L, F1R, F2L, F2R, F25XL, F25XR, F25YL, F25YR, F5L, F5R, F7L, F7R
+                                                )
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
+                       (fingerprint, schema.settings_coarse_key(row), fingerprint, settings["Model"], settings["Coeff"], settings["Nuclide"], settings["Intensity"], 
+                        settings["Symbol"], settings["A"], settings["Z"], settings["N"], settings["F0Be"], 
+                        settings["F1t"], settings["F1a"], settings["F5Mat"], settings["F5t"], settings["F5a"], 
+                        settings["D1_Brho"], settings["D2_Brho"], settings["D3_Brho"], settings["D4_Brho"], 
+                        settings["D5_Brho"], settings["D6_Brho"], settings["D7_Brho"], settings["D8_Brho"],
+                        settings["D1_Energy"], settings["D2_Energy"], settings["D3_Energy"], settings["D4_Energy"],
+                        settings["D5_Energy"], settings["D6_Energy"], settings["D7_Energy"], settings["D8_Energy"],
+                        settings["DumpL"], settings["DumpR"], settings["F1L"], settings["F1R"], settings["F2L"], settings["F2R"],
+                        settings["F2.5XL"], settings["F2.5XR"], settings["F2.5YL"], settings["F2.5YR"], 
+                        settings["F5L"], settings["F5R"], settings["F7L"], settings["F7R"]))
+        setting_id = cursor.lastrowid  # 新しいIDを取得
+
+    return setting_id
+
+# LPP の全 [section] key = value を JSON で保存する関数 ({section: {key: value}}, 値は LPP の文字列のまま)
+#   既にその setting_id の行があれば最初に取り込んだものを残す (isotopes と同じ)
+def insert_params(cursor, setting_id, sections):
+    cursor.execute('''
+        INSERT INTO setting_params (setting_id, params) VALUES (?, ?)
+        ON CONFLICT(setting_id) DO NOTHING
+    ''', (setting_id, json.dumps(sections, ensure_ascii=False)))
+
+# 保存する量と [Calculations] の (ブロック名, 量) の対応 (列番号は column_map() で求める)
+isotope_columns = {
+    "Yield": ("Total", "Yield"),
+    "x_section": ("Total", "x_section"),
+    "Transmission": ("Total", "Transmission"),
+    "Transmission_F1slit": ("F1 slit", "Transmission"),
+    "Transmission_F2slit": ("F2 slit", "Transmission"),
+    "Transmission_F25slit": ("F2.5 slit", "Transmission"),
+    "Transmission_F5slit": ("F5 slit", "Transmission"),
+    "Transmission_F7slit": ("F7 slit", "Transmission"),
+    "Qratio_F3": ("F3DPPAC2", "Qratio"),
+    "Qratio_F5": ("F5DPPAC2", "Qratio"),
+    "Unreacted_F5": ("F5 Wedge", "Unreacted"),
+}
 
-def extract_isotope_info(isotope, element_dict):
-    # 同位体名の最初の文字を取得
-    isotope_name = ''.join(filter(str.isalpha, isotope))  # Nb などの元素記号を抽出
-    mass_number = int(''.join(filter(str.isdigit, isotope)))  # 質量数を抽出（例：105）
+# [Calculations] のチャンクから保存候補の行を選ぶ関数
+#   D3 以降 (j = 3 ~ 8) の荷電状態が j = 1 と等しい行について isotope_indices の列だけを残す
+#   (0.1 % の判定には全行の合計が必要なので、その判定は insert_isotopes() で行う)
+def select_isotopes(chunks, isotope_indices, n_cols):
+    total_sum = 0.0
+    kept_names = []
+    kept_values = []
+
+    for names, charges, values in chunks:
+        # ブロック構成から求めた列数と合わなければ、違う列を読んでしまうので止める
+        if values.shape[1] != n_cols:
+            raise ValueError(f"[Calculations] の列数 {values.shape[1]} が BlockStructure から求めた列数 {n_cols} と一致しません")
+
+        total_sum += values[:, 0].sum()
+        equal_values = np.all(charges[:, 2:] == charges[:, :1], axis=1)
+        kept_names.extend(names[i] for i in np.flatnonzero(equal_values))
+        kept_values.append(values[equal_values][:, isotope_indices])
+
+    if kept_values:
+        values = np.vstack(kept_values)
+    else:
+        values = np.zeros((0, len(isotope_indices)))
 
-    # 原子番号を取得
-    atomic_number = element_dict.get(isotope_name)
+    return total_sum, kept_names, values
 
-    # 中性子数を計算
-    if atomic_number is not None:
-        neutron_number = mass_number - atomic_number
-        return mass_number, atomic_number, neutron_number
-    else:
-        return None, None  # 存在しない元素名の場合
-
-isotope = []
-
-# 全ての同位体を処理する
-for i in range(len(Isotope)):
-    # Isotope[i][0]を除く部分をfloatに変換し、isotopeに追加
-    isotope.append([float(value) for value in Isotope[i][1:]])
-
-total_sum = sum(row[0] for row in isotope)
-
-print(total_sum)
-
-# SQLiteにデータを保存するための準備
-conn = sqlite3.connect('settings.db')
-cursor = conn.cursor()
-
-# 同位体情報を保存するためのテーブル作成
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS isotopes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        setting_id INTEGER,
-        isotope_name TEXT,
-        A INTEGER,
-        Z INTEGER,
-        N INTEGER,
-        Yield REAL,
-        percent1 REAL,
-        x_section REAL,
-        Transmission REAL,
-        Transmission_F1slit REAL,
-        Transmission_F2slit REAL,
-        Transmission_F25slit REAL,
-        Transmission_F5slit REAL,
-        Transmission_F7slit REAL,
-        Qratio_F3 REAL,
-        Qratio_F5 REAL,
-        Unreacted_F5 REAL,
-        UNIQUE(setting_id, isotope_name)  -- setting_id と isotope_name の組み合わせでユニーク制約を追加
-        FOREIGN KEY (setting_id) REFERENCES settings(id)
-    )
-''')
-
-# 各同位体に対して情報を出力
-for i in range(len(Isotope)):
-    isotope_name = Isotope[i][0].split()[0]  # 同位体名を取得
-    A, Z, N = extract_isotope_info(isotope_name, element_dict)
-    
-    # j = 1 ~ 8 に関して値が等しいかチェック
-    first_value = Isotope[i][0].split()[1]  # j = 1 の値を基準として取得
-    equal_values = True  # 値が等しいかどうかのフラグ
-
-    #for j in range(1, 9):  # j = 1 から 8 まで
-    for j in range(3, 9):  # j = 1 から 8 まで
-        if Isotope[i][0].split()[j] != first_value:
-        #if Isotope[i][0].split()[j] != Z:
-            equal_values = False
-            break  # 等しくない場合、ループを終了
-    if isotope[i][0]/total_sum * 100 < 0.1:
-        equal_values = False
-
-    # 値が等しい場合の処理
-    if equal_values:
-        # 各同位体の情報を表示
-        print(f"{isotope_name:>5s}, {A:>3d}, {Z:>2d}, {N:>2d}, {isotope[i][0]:4.1f}, {100 * isotope[i][0]/total_sum:4.1f}, {isotope[i][4]:.1e}, {isotope[i][6]:.1e}, {isotope[i][41]:.1e}, {isotope[i][59]:.1e}, {isotope[i][69]:.1e}, {isotope[i][161]:.1e}, {isotope[i][232]:.1e}, {isotope[i][133]:.2e}, {isotope[i][180]:.2e}, {isotope[i][166]:.2e}")
+# 解析結果から作る setting_id ごとの行 (解析し直したファイルはこれらを消してから書き直す)
+#   setting_summary は update_setting_summary() が INSERT OR REPLACE で書き直す
+PARSED_TABLES = ["isotopes", "charge_states", "charge_state_totals", "setting_params", "calculation_files"]
+
+# 設定の解析結果の行を消す関数 (同じ設定の LPP を解析し直したとき、古い PARSER_VERSION の値を残さないようにする)
+def clear_parsed_rows(cursor, setting_id):
+    for table in PARSED_TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE setting_id = ?", (setting_id,))
+
+# 同位体情報を保存する関数
+def insert_isotopes(cursor, setting_id, isotopes):
+    total_sum, names, values = isotopes
+    percents = values[:, 0] / total_sum * 100
+
+    # 0.1 % 以上の行だけを残す
+    selected = ~(percents < 0.1)
+
+    print(total_sum)
 
-        # 必要な情報を変数に格納
-        Yield = float(isotope[i][0])
+    # 各同位体に対して情報を出力し、保存する行をまとめる
+    isotope_rows = []
+    for i in np.flatnonzero(selected):
+        isotope_name = names[i]  # 同位体名を取得
+        nid = nuclide.name_to_id(isotope_name)
+        A, Z, N = nuclide.A_of(nid), nuclide.Z_of(nid), nuclide.N_of(nid)
+
+        # 必要な情報を変数に格納 (isotope_columns の順番)
+        (Yield, x_section, Transmission, Transmission_F1slit, Transmission_F2slit, Transmission_F25slit,
+         Transmission_F5slit, Transmission_F7slit, Qratio_F3, Qratio_F5, Unreacted_F5) = (float(v) for v in values[i])
         percent1 = 100 * Yield / total_sum  # 百分率計算
-        x_section = float(isotope[i][4])
-        Transmission = float(isotope[i][6])
-        Transmission_F1slit = float(isotope[i][41])
-        Transmission_F2slit = float(isotope[i][59])
-        Transmission_F25slit = float(isotope[i][69])
-        Transmission_F5slit = float(isotope[i][161])
-        Transmission_F7slit = float(isotope[i][232])
-        Qratio_F3 = float(isotope[i][133])
-        Qratio_F5 = float(isotope[i][180])
-        Unreacted_F5 = float(isotope[i][166])
-
-        # 既存のデータを確認
+
+        # 各同位体の情報を表示
+        print(f"{isotope_name:>5s}, {A:>3d}, {Z:>2d}, {N:>2d}, {Yield:4.1f}, {percents[i]:4.1f}, {x_section:.1e}, {Transmission:.1e}, {Transmission_F1slit:.1e}, {Transmission_F2slit:.1e}, {Transmission_F25slit:.1e}, {Transmission_F5slit:.1e}, {Transmission_F7slit:.1e}, {Qratio_F3:.2e}, {Qratio_F5:.2e}, {Unreacted_F5:.2e}")
+
+        isotope_rows.append((setting_id, isotope_name, nid, A, Z, N, Yield, percent1, x_section, Transmission, Transmission_F1slit, Transmission_F2slit, Transmission_F25slit, Transmission_F5slit, Transmission_F7slit, Qratio_F3, Qratio_F5, Unreacted_F5))
+
+    # まとめて保存 (同じファイルに同じ isotope_name の行が複数あれば最初の行を残す)
+    cursor.executemany('''
+        INSERT INTO isotopes (setting_id, isotope_name, nuclide_id, A, Z, N, Yield, percent1, x_section, Transmission, Transmission_F1slit, Transmission_F2slit, Transmission_F25slit, Transmission_F5slit, Transmission_F7slit, Qratio_F3, Qratio_F5, Unreacted_F5)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(setting_id, isotope_name) DO NOTHING
+    ''', isotope_rows)
+
+# 荷電状態ごとの全行と、核種ごとの合計を保存する関数
+def insert_charge_states(cursor, setting_id, spool):
+    n_rows = spool['n_rows']
+    if n_rows == 0:
+        return
+
+    names = np.array(spool['names'])
+    charges = np.vstack(spool['charges']).astype(np.int8)
+    yields = np.concatenate(spool['yields'])
+    total_sum = yields.sum()
+
+    # 核種 ID ごとにまとめる
+    ids = nuclide.names_to_ids(names)
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    A, Z, N = nuclide.A_of(ids), nuclide.Z_of(ids), nuclide.N_of(ids)
+
+    # 全ダイポールで荷電状態 = Z なら完全電離
+    fully_stripped = np.all(charges == Z[:, None], axis=1)
+
+    cursor.executemany('''
+        INSERT INTO charge_states (setting_id, row_index, isotope_name, nuclide_id, A, Z, N, charges, fully_stripped, Yield, percent1)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(setting_id, row_index) DO NOTHING
+    ''', ((setting_id, i, str(names[i]), int(ids[i]), int(A[i]), int(Z[i]), int(N[i]), charges[i].tobytes(),
+           int(fully_stripped[i]), float(yields[i]), float(yields[i] / total_sum * 100)) for i in range(n_rows)))
+
+    # 核種ごとの合計を一括で集計
+    n_per_nuclide = np.bincount(inverse, minlength=len(unique_ids))
+    yield_all = np.bincount(inverse, weights=yields, minlength=len(unique_ids))
+    yield_stripped = np.bincount(inverse, weights=np.where(fully_stripped, yields, 0.0), minlength=len(unique_ids))
+    contamination = np.divide(yield_all - yield_stripped, yield_all,
+                              out=np.zeros_like(yield_all), where=yield_all > 0)
+
+    cursor.executemany('''
+        INSERT INTO charge_state_totals (setting_id, isotope_name, nuclide_id, A, Z, N, n_rows, Yield_all, Yield_fully_stripped, contamination)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(setting_id, isotope_name) DO NOTHING
+    ''', ((setting_id, nuclide.id_to_name(nid), int(nid), int(nuclide.A_of(nid)), int(nuclide.Z_of(nid)), int(nuclide.N_of(nid)),
+           int(n_per_nuclide[k]), float(yield_all[k]), float(yield_stripped[k]), float(contamination[k]))
+          for k, nid in enumerate(unique_ids)))
+
+# 保存した荷電状態のバイト列を D1 ~ D8 の荷電状態の配列に戻す関数
+def decode_charges(blob):
+    return np.frombuffer(blob, dtype=np.int8)
+
+# NPY ファイルを置くディレクトリ (接続しているデータベースと同じ場所の NPY/)
+def calculations_dir(cursor):
+    cursor.execute("PRAGMA database_list")
+    db_file = next((row[2] for row in cursor.fetchall() if row[1] == "main"), "")
+    return os.path.join(os.path.dirname(db_file) if db_file else ".", CALCULATIONS_DIR)
+
+# 同じディレクトリの一時ファイルに書いてから path に置き換える関数 (write(out) で中身を書く)
+#   既存のファイルをその場で書き換えないので、同じ inode を共有するファイル (ハードリンク) や読み込み中の mmap は変わらない
+def replace_file(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            write(out)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+# 一時ファイルに書き出した [Calculations] の全数値を NPY/{setting_id}.npy として保存する関数
+#   既にその setting_id の NPY があれば最後に解析したもので上書きする (calculation_files の行は clear_parsed_rows() で消してある)
+def store_calculations(cursor, setting_id, spool):
+    try:
+        npy_dir = calculations_dir(cursor)
+        os.makedirs(npy_dir, exist_ok=True)
+        path = f"{CALCULATIONS_DIR}/{setting_id}.npy"
+        labels_path = f"{CALCULATIONS_DIR}/{setting_id}_labels.npy"
+
+        # ヘッダーを書いてから一時ファイルの中身をそのままコピー
+        header = {'descr': np.lib.format.dtype_to_descr(CALCULATIONS_DTYPE), 'fortran_order': False,
+                  'shape': (spool['n_rows'], spool['n_cols'])}
+        def write_values(out):
+            np.lib.format.write_array_header_1_0(out, header)
+            with open(spool['path'], 'rb') as tmp:
+                shutil.copyfileobj(tmp, out)
+        replace_file(os.path.join(npy_dir, f"{setting_id}.npy"), write_values)
+
+        # 核種名と荷電状態
+        n_charges = spool['charges'][0].shape[1] if spool['charges'] else 0
+        labels = np.zeros(spool['n_rows'], dtype=[('name', 'U8'), ('charges', '<i2', (n_charges,))])
+        if spool['n_rows']:
+            labels['name'] = spool['names']
+            labels['charges'] = np.vstack(spool['charges'])
+        replace_file(os.path.join(npy_dir, f"{setting_id}_labels.npy"), lambda out: np.save(out, labels))
+
         cursor.execute('''
-            SELECT COUNT(*) FROM isotopes 
-            WHERE setting_id = ? AND isotope_name = ?
-        ''', (setting_id, isotope_name))
-        
-        exists = cursor.fetchone()[0] > 0  # データが既に存在するか確認
-        
-        # データが存在しない場合のみ追加
-        if not exists:
-            cursor.execute('''
-                INSERT INTO isotopes (setting_id, isotope_name, A, Z, N, Yield, percent1, x_section, Transmission, Transmission_F1slit, Transmission_F2slit, Transmission_F25slit, Transmission_F5slit, Transmission_F7slit, Qratio_F3, Qratio_F5, Unreacted_F5)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (setting_id, isotope_name, A, Z, N, Yield, percent1, x_section, Transmission, Transmission_F1slit, Transmission_F2slit, Transmission_F25slit, Transmission_F5slit, Transmission_F7slit, Qratio_F3, Qratio_F5, Unreacted_F5))
-            conn.commit()  # データを保存
-
-# データベースを閉じる
-conn.close()
-
-print("同位体の情報がデータベースに追加されました。")
+            INSERT INTO calculation_files (setting_id, path, labels_path, n_rows, n_cols, dtype)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (setting_id, path, labels_path, spool['n_rows'], spool['n_cols'], CALCULATIONS_DTYPE.str))
+    finally:
+        os.remove(spool['path'])
+
+# setting_id の [Calculations] 全数値を読む関数
+#   values はメモリマップされた (行数 × 列数) の配列、labels は各行の核種名 ('name') と荷電状態 ('charges')
+def load_calculations(setting_id, db_path="settings.db"):
+    npy_dir = os.path.join(os.path.dirname(os.path.abspath(db_path)), CALCULATIONS_DIR)
+    values = np.load(os.path.join(npy_dir, f"{setting_id}.npy"), mmap_mode='r')
+    labels = np.load(os.path.join(npy_dir, f"{setting_id}_labels.npy"))
+    return labels, values
+
+# LPP ファイル 1 つを解析する関数 (DB には触らないのでワーカープロセスで実行できる)
+def parse_lpp(file_path, spool_dir=None):
+    # 抽出結果を取得
+    data, sections, isotopes, spool = extract_data_from_file(file_path, spool_dir)
+    settings = build_settings(data)
+    return file_path, data, settings, sections, isotopes, spool
+
+# LPP ファイル 1 つを解析する関数 (解析できないファイルは例外の代わりに (file_path, エラーメッセージ) を返す)
+#   1 つの壊れたファイルでバッチ全体が止まらないように、ワーカープロセスではこちらを使う
+def try_parse_lpp(file_path, spool_dir=None):
+    try:
+        return parse_lpp(file_path, spool_dir)
+    except (OSError, KeyError, ValueError, IndexError) as error:
+        return file_path, f"{type(error).__name__}: {error}"
+
+# 解析結果を DB に書き込む関数 (書き込みは常にこのプロセス 1 つだけ)
+def write_parsed(cursor, parsed):
+    file_path, data, settings, sections, isotopes, spool = parsed
+    print(data)
+
+    # 結果を表示
+    print(settings)
+
+    setting_id = insert_settings(cursor, settings)
+
+    # temp.lpp を取り込んだときだけ、ファイルを指定されたディレクトリに保存
+    #   (まとめて取り込むファイルは同じディレクトリにあるので、コピーで未処理のファイルを上書きしないようにする)
+    if os.path.abspath(file_path) == os.path.abspath(TEMP_LPP):
+        output_file_path = f"./LPP/BigRIPS_No{setting_id:02d}_136Xe_{settings['Symbol']}.lpp"
+        if os.path.exists(output_file_path):
+            print(f"警告: {output_file_path} が既にあるのでコピーしません。ID: {setting_id}")
+        else:
+            shutil.copy(file_path, output_file_path)
+            print(f"ファイルを {output_file_path} に保存しました。ID: {setting_id}")
+
+    # 既存の設定なら、前に解析したときの行を最後に解析した結果で置き換える
+    clear_parsed_rows(cursor, setting_id)
+
+    insert_params(cursor, setting_id, sections)
+    insert_isotopes(cursor, setting_id, isotopes)
+    schema.update_setting_summary(cursor, setting_id, float(isotopes[0]))
+
+    print("同位体の情報がデータベースに追加されました。")
+
+    insert_charge_states(cursor, setting_id, spool)
+    store_calculations(cursor, setting_id, spool)
+
+    return setting_id
+
+# LPP ファイル 1 つを取り込む関数
+def ingest_lpp(cursor, file_path):
+    return write_parsed(cursor, parse_lpp(file_path))
+
+# LPP ファイルの生バイト列と PARSER_VERSION から内容ハッシュを計算する関数
+def lpp_content_hash(file_path):
+    sha = hashlib.sha256(f"parser_version:{PARSER_VERSION}\n".encode())
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+# 内容ハッシュから取り込み済みの setting_id を探す関数 (無ければ None)
+def lookup_lpp_file(cursor, content_hash):
+    cursor.execute('''
+        SELECT F.setting_id FROM lpp_files F JOIN settings S ON F.setting_id = S.id
+        WHERE F.content_hash = ?
+    ''', (content_hash,))
+    result = cursor.fetchone()
+    return None if result is None else result[0]
+
+# 取り込んだ LPP ファイルを lpp_files に登録する関数
+def record_lpp_file(cursor, content_hash, setting_id, file_path):
+    cursor.execute('''
+        INSERT OR REPLACE INTO lpp_files (content_hash, parser_version, setting_id, file_path, ingested_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (content_hash, PARSER_VERSION, setting_id, file_path, datetime.now().isoformat(timespec='seconds')))
+
+# 使えるコア数 (ワーカー数の既定値)
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# LPP ファイルを順番に解析した結果を返すジェネレータ
+#   jobs > 1 ならプロセスプールで並列に解析し、結果はファイルの順番どおりに返す
+#   解析できなかったファイルは (file_path, エラーメッセージ) を返す (try_parse_lpp)
+#   [Calculations] の一時ファイルは spool_dir に作る (呼び出し側がディレクトリごと消す)
+def parse_files(file_paths, jobs=1, spool_dir=None):
+    if jobs <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield try_parse_lpp(file_path, spool_dir)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(file_paths))) as executor:
+        yield from executor.map(try_parse_lpp, file_paths, [spool_dir] * len(file_paths))
+
+# 引数のパスやグロブ (例: LPP/SHARE/BigRIPS_No*_136Xe_*.lpp) を LPP ファイルのリストに展開
+def expand_lpp_paths(patterns):
+    file_paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            print(f"警告: {pattern} に対応するファイルが見つかりません")
+        for file_path in matches:
+            if file_path not in file_paths:
+                file_paths.append(file_path)
+    return file_paths
+
+# 複数の LPP ファイルを 1 接続・1 トランザクションで取り込む関数
+#   force=True なら lpp_files のキャッシュを無視してすべて解析し直す
+def ingest_files(file_paths, db_path="settings.db", jobs=1, force=False):
+    # SQLiteデータベースの接続
+    conn = dbconn.connect(db_path)
+    cursor = conn.cursor()
+
+    setting_ids = [None] * len(file_paths)
+    failed = []
+    with conn:
+        schema.migrate(cursor)
+
+        # 内容が変わっていないファイルは解析せずに既存の setting_id を使う
+        content_hashes = [lpp_content_hash(file_path) for file_path in file_paths]
+        pending = []
+        for i, file_path in enumerate(file_paths):
+            cached_id = None if force else lookup_lpp_file(cursor, content_hashes[i])
+            if cached_id is None:
+                pending.append(i)
+            else:
+                print(f"スキップ: {file_path} (取り込み済み ID: {cached_id})")
+                setting_ids[i] = cached_id
+
+        # 解析は並列、書き込みはファイルの順番どおりにこの接続だけで行う (setting_id が決まった順に振られる)
+        #   [Calculations] の一時ファイルはこの関数の一時ディレクトリに作り、途中で止まってもディレクトリごと消す
+        with tempfile.TemporaryDirectory(prefix="lise2db_") as spool_dir:
+            parsed_files = parse_files([file_paths[i] for i in pending], jobs, spool_dir)
+            try:
+                for i, parsed in zip(pending, parsed_files):
+                    if len(parsed) == 2:
+                        print(f"失敗: {parsed[0]} ({parsed[1]})")
+                        failed.append(file_paths[i])
+                        continue
+
+                    # 書き込み中に失敗したファイルの行だけを取り消す (ほかのファイルは同じトランザクションで保存する)
+                    print(f"処理中: {parsed[0]}")
+                    cursor.execute("SAVEPOINT lpp_file")
+                    try:
+                        setting_ids[i] = write_parsed(cursor, parsed)
+                        record_lpp_file(cursor, content_hashes[i], setting_ids[i], file_paths[i])
+                    except (KeyError, ValueError, IndexError) as error:
+                        cursor.execute("ROLLBACK TO lpp_file")
+                        print(f"失敗: {parsed[0]} ({type(error).__name__}: {error})")
+                        setting_ids[i] = None
+                        failed.append(file_paths[i])
+                    cursor.execute("RELEASE lpp_file")
+            finally:
+                # 解析中のワーカーを止めてから一時ディレクトリを消す
+                parsed_files.close()
+
+    # データベースを閉じる
+    conn.close()
+
+    print(f"{len(pending) - len(failed)} 個の LPP ファイルを取り込みました (スキップ: {len(file_paths) - len(pending)} 個, 失敗: {len(failed)} 個)。")
+
+    return setting_ids
+
+# LPP ファイルの設定が既に DB にあるかどうかを調べる関数 (DB には書き込まない)
+def check_files(file_paths, db_path="settings.db", jobs=1):
+    conn = dbconn.connect_readonly(db_path)
+    cursor = conn.cursor()
+
+    with tempfile.TemporaryDirectory(prefix="lise2db_") as spool_dir:
+        parsed_files = parse_files(file_paths, jobs, spool_dir)
+        try:
+            for parsed in parsed_files:
+                if len(parsed) == 2:
+                    print(f"{parsed[0]}: 解析できません ({parsed[1]})")
+                    continue
+                file_path, data, settings, sections, isotopes, spool = parsed
+                os.remove(spool['path'])
+                report_setting(cursor, file_path, settings)
+        finally:
+            parsed_files.close()
+
+    conn.close()
+
+# 同じ設定や似た設定が DB にあるかを表示する関数
+def report_setting(cursor, file_path, settings):
+    setting_id = find_setting(cursor, settings)
+    similar_ids = [i for i in find_similar_settings(cursor, settings) if i != setting_id]
+    if setting_id is not None:
+        print(f"{file_path}: 同じ設定があります (ID: {setting_id})")
+    elif similar_ids:
+        print(f"{file_path}: スリット幅などだけが違う設定があります (ID: {', '.join(map(str, similar_ids))})")
+    else:
+        print(f"{file_path}: 新しい設定です")
+
+def main():
+    parser = argparse.ArgumentParser(description="LISE++ の LPP ファイルを settings.db に取り込む")
+    parser.add_argument("lpp", nargs="*", default=[TEMP_LPP],
+                        help="LPP ファイルのパスまたはグロブ (既定: ./LPP/temp.lpp)")
+    parser.add_argument("--db", default="settings.db", help="SQLite データベースのパス")
+    parser.add_argument("-j", "--jobs", type=int, default=available_cores(),
+                        help="LPP ファイルを解析するワーカープロセス数 (既定: 使えるコア数)")
+    parser.add_argument("--force", action="store_true",
+                        help="取り込み済みのファイルも解析し直す")
+    parser.add_argument("--check", action="store_true",
+                        help="取り込まずに、同じ設定や似た設定が DB にあるかだけを表示する")
+    args = parser.parse_args()
+
+    if args.check:
+        check_files(expand_lpp_paths(args.lpp), args.db, args.jobs)
+    else:
+        ingest_files(expand_lpp_paths(args.lpp), args.db, args.jobs, args.force)
+
+if __name__ == "__main__":
+    main()
 
 # Ion Production Rate    : 001 番目 (4.13)
 # X-Section in target    : 005 番目 (4.18e-6)
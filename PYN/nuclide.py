@@ -0,0 +1,76 @@
+import numpy as np
+
+# ===== 核種の登録簿 (lise2db.py / db2root.py / db2root_sum.py 共通) ==============================
+# 核種 ID = Z * 1000 + A (例: 99Zr -> 40099)
+#   整数 1 つで核種が決まるので、DB では索引付きの整数列として JOIN / 検索に使う
+
+# 原子番号を元素記号から取得する辞書
+element_dict = {
+    "H": 1, "He": 2, "Li": 3, "Be": 4, "B": 5, "C": 6,
+    "N": 7, "O": 8, "F": 9, "Ne": 10, "Na": 11, "Mg": 12,
+    "Al": 13, "Si": 14, "P": 15, "S": 16, "Cl": 17, "Ar": 18,
+    "K": 19, "Ca": 20, "Sc": 21, "Ti": 22, "V": 23, "Cr": 24,
+    "Mn": 25, "Fe": 26, "Co": 27, "Ni": 28, "Cu": 29, "Zn": 30,
+    "Ga": 31, "Ge": 32, "As": 33, "Se": 34, "Br": 35, "Kr": 36,
+    "Rb": 37, "Sr": 38, "Y": 39, "Zr": 40, "Nb": 41, "Mo": 42,
+    "Tc": 43, "Ru": 44, "Rh": 45, "Pd": 46, "Ag": 47, "Cd": 48,
+    "In": 49, "Sn": 50, "Sb": 51, "Te": 52, "I": 53, "Xe": 54,
+    "Cs": 55, "Ba": 56, "La": 57, "Ce": 58, "Pr": 59, "Nd": 60,
+    "Pm": 61, "Sm": 62, "Eu": 63, "Gd": 64, "Tb": 65, "Dy": 66,
+    "Ho": 67, "Er": 68, "Tm": 69, "Yb": 70, "Lu": 71, "Hf": 72,
+    "Ta": 73, "W": 74, "Re": 75, "Os": 76, "Ir": 77, "Pt": 78,
+    "Au": 79, "Hg": 80, "Tl": 81, "Pb": 82, "Bi": 83, "Po": 84,
+    "At": 85, "Rn": 86, "Fr": 87, "Ra": 88, "Ac": 89, "Th": 90,
+    "Pa": 91, "U": 92, "Np": 93, "Pu": 94, "Am": 95, "Cm": 96,
+    "Bk": 97, "Cf": 98, "Es": 99, "Fm": 100, "Md": 101, "No": 102,
+    "Lr": 103, "Rf": 104, "Db": 105, "Sg": 106, "Bh": 107, "Hs": 108,
+    "Mt": 109, "Ds": 110, "Rg": 111, "Cn": 112, "Nh": 113, "Fl": 114,
+    "Mc": 115, "Lv": 116, "Ts": 117, "Og": 118
+}
+
+# 原子番号 -> 元素記号 (配列の添字が Z, Z = 0 は空文字)
+MAX_Z = max(element_dict.values())
+SYMBOLS = np.array([""] + sorted(element_dict, key=element_dict.get))
+
+# 核種名 -> 核種 ID のキャッシュ
+name_cache = {}
+
+# 核種 ID を作る関数
+def nuclide_id(A, Z):
+    return Z * 1000 + A
+
+# 核種 ID から Z / A / N を求める関数 (整数でも numpy 配列でもよい)
+def Z_of(ids):
+    return ids // 1000
+
+def A_of(ids):
+    return ids % 1000
+
+def N_of(ids):
+    return ids % 1000 - ids // 1000
+
+# 核種名 ("99Zr") -> 核種 ID (存在しない元素名の場合は None)
+def name_to_id(name):
+    if name not in name_cache:
+        symbol = name.lstrip('0123456789')  # Zr などの元素記号を抽出
+        mass = name[:len(name) - len(symbol)]  # 質量数を抽出 (例: 99)
+        Z = element_dict.get(symbol)
+        name_cache[name] = nuclide_id(int(mass), Z) if Z is not None and mass else None
+    return name_cache[name]
+
+# 核種 ID -> 核種名 ("99Zr")
+def id_to_name(nid):
+    return f"{A_of(nid)}{SYMBOLS[Z_of(nid)]}"
+
+# 核種名 -> (A, Z, N) (存在しない元素名の場合は None)
+def isotope_info(name):
+    nid = name_to_id(name)
+    if nid is None:
+        return None
+    return A_of(nid), Z_of(nid), N_of(nid)
+
+# 核種名の配列 -> 核種 ID の配列 (種類ごとに 1 回だけ名前を解釈する)
+def names_to_ids(names):
+    unique_names, inverse = np.unique(np.asarray(names), return_inverse=True)
+    unique_ids = np.array([name_to_id(str(name)) for name in unique_names], dtype=np.int64)
+    return unique_ids[inverse]
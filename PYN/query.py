@@ -0,0 +1,193 @@
+import argparse
+import sqlite3
+
+import dbconn
+import nuclide
+import schema
+
+# ===== settings.db の検索 (読み取り専用) ===========================================================
+
+# settings テーブルの列名 (小文字 -> 列名)
+def settings_columns(cursor):
+    return {row[1].lower(): row[1] for row in cursor.execute("PRAGMA table_info(settings)")}
+
+# 1 つの条件の SQL と パラメータを作る関数
+#   値が (最小, 最大) なら範囲 (片方が None なら片側だけ)、それ以外は一致
+def value_clauses(expression, value):
+    clauses = []
+    params = []
+    if isinstance(value, (tuple, list)):
+        low, high = value
+        if low is not None:
+            clauses.append(f"{expression} >= ?")
+            params.append(low)
+        if high is not None:
+            clauses.append(f"{expression} <= ?")
+            params.append(high)
+    else:
+        clauses.append(f"{expression} = ?")
+        params.append(value)
+    return clauses, params
+
+# LPP のパラメータ名 ("[settings]Energy" または JSON パス '$.settings.Energy') を JSON パスにする関数
+def lpp_path(name):
+    if name.startswith("["):
+        section, key = name[1:].split("]", 1)
+        return schema.param_path(section, key)
+    return name
+
+# 検索条件から WHERE 句とパラメータを作る関数
+#   filters は settings の列、lpp は LPP の全パラメータ (setting_params) に対する条件
+#   lpp の値が数値なら数値として (単位は無視)、文字列なら文字列として比べる
+def settings_where(cursor, filters, lpp=None):
+    columns = settings_columns(cursor)
+    clauses = []
+    params = []
+    for key, value in filters.items():
+        column = columns.get(key.lower())
+        if column is None:
+            raise KeyError(f"settings に {key} という列はありません")
+        column_clauses, column_params = value_clauses(column, value)
+        clauses += column_clauses
+        params += column_params
+
+    for name, value in (lpp or {}).items():
+        bounds = value if isinstance(value, (tuple, list)) else (value,)
+        numeric = all(bound is None or isinstance(bound, (int, float)) for bound in bounds)
+        expression = schema.param_expression(lpp_path(name), numeric)
+        param_clauses, param_params = value_clauses(expression, value)
+        clauses.append(f"id IN (SELECT setting_id FROM setting_params WHERE {' AND '.join(param_clauses)})")
+        params += param_params
+
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+# 条件に合う設定を辞書のリストで返す関数
+#   例: find_settings(symbol="99Zr", d1_brho=(6.5, 6.7)), find_settings(f1t=(None, 3.0)),
+#       find_settings(lpp={"[settings]Energy": (300, 350), "[settings]RF frequency": 20})
+#   Symbol, D1_Brho ~ D8_Brho, F1t, F5t と schema.PARAM_INDEXES のパスには索引があるので、SQLite の範囲検索になる
+def find_settings(db_path=dbconn.DB_PATH, lpp=None, **filters):
+    conn = dbconn.connect_readonly(db_path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+
+    where, params = settings_where(cursor, filters, lpp)
+    cursor.execute(f"SELECT * FROM settings{where} ORDER BY id", params)
+    rows = [dict(row) for row in cursor.fetchall()]
+
+    conn.close()
+    return rows
+
+# 設定の LPP パラメータを 1 つ取り出す関数 (例: lpp_param(2, "[settings]Energy") -> "345 MeV/u")
+def lpp_param(setting_id, name, db_path=dbconn.DB_PATH):
+    conn = dbconn.connect_readonly(db_path)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {schema.param_expression(lpp_path(name), False)} FROM setting_params WHERE setting_id = ?",
+                   (setting_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row is not None else None
+
+# ===== 核種 -> 設定の順位 (nuclide_settings の逆引き表) ===============================================
+
+# 並べ替えの基準 -> スコアの SQL 式
+#   yield: 収量, purity: 純度 (percent1),
+#   weighted: 収量 (その核種の全設定での最大値で規格化) と純度 (0 ~ 1) の重み付き和 (weight が収量の重み)
+RANKING_SCORES = {
+    "yield": "Yield",
+    "purity": "percent1",
+    "weighted": ":weight * Yield / MAX(Yield) OVER (PARTITION BY Z, N) + (1 - :weight) * percent1 / 100",
+}
+
+# 核種ごとに、スコアの高い設定を上から top 個ずつ返す関数
+#   name ("99Zr") か z / n を指定するとその核種だけ、何も指定しなければ全核種
+#   min_purity を指定すると percent1 がそれ未満の設定は順位に入れない
+#   例: rank_settings("99Zr", by="weighted", weight=0.7, min_purity=1.0, top=3)
+def rank_settings(name=None, z=None, n=None, by="yield", weight=0.5, min_purity=None, top=5, db_path=dbconn.DB_PATH):
+    if by not in RANKING_SCORES:
+        raise KeyError(f"並べ替えの基準は {', '.join(RANKING_SCORES)} のどれかです")
+    if name is not None:
+        nid = nuclide.name_to_id(name)
+        if nid is None:
+            raise KeyError(f"{name} という核種はありません")
+        z, n = nuclide.Z_of(nid), nuclide.N_of(nid)
+
+    clauses = []
+    if z is not None:
+        clauses.append("Z = :z")
+    if n is not None:
+        clauses.append("N = :n")
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+
+    query = f"""
+    SELECT R.Z, R.N, R.isotope_name, R.rank, R.setting_id, S.Symbol, R.Yield, R.percent1, R.Transmission, R.score
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY Z, N ORDER BY score DESC, setting_id) AS rank
+        FROM (SELECT *, {RANKING_SCORES[by]} AS score FROM nuclide_settings{where})
+        WHERE :min_purity IS NULL OR percent1 >= :min_purity
+    ) R
+    JOIN settings S ON S.id = R.setting_id
+    WHERE R.rank <= :top
+    ORDER BY R.Z, R.N, R.rank
+    """
+
+    conn = dbconn.connect_readonly(db_path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(query, {"z": z, "n": n, "weight": weight, "min_purity": min_purity, "top": top})
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+# コマンドラインの "列=値" / "列=最小:最大" を検索条件にする関数 (数値として読めるものは float)
+def parse_filter(argument):
+    key, value = argument.split("=", 1)
+
+    def number(text):
+        if text == "":
+            return None
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+    if ":" in value:
+        low, high = value.split(":", 1)
+        return key, (number(low), number(high))
+    return key, number(value)
+
+# 使い方:
+#   python3 ./PYN/query.py settings symbol=99Zr d1_brho=6.5:6.7
+#   python3 ./PYN/query.py settings "[settings]Energy=300:350" "[settings]RF frequency=20"
+#   python3 ./PYN/query.py rank 99Zr --by weighted --weight 0.7 --min-purity 1 --top 3
+def main():
+    parser = argparse.ArgumentParser(description="settings.db を検索する")
+    parser.add_argument("--db", default=dbconn.DB_PATH, help="SQLite データベースのパス")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    settings_parser = commands.add_parser("settings", help="条件に合う設定を表示する")
+    settings_parser.add_argument("filters", nargs="*", help="列=値 または 列=最小:最大 ([section]key=... で LPP のパラメータ)")
+
+    rank_parser = commands.add_parser("rank", help="核種ごとにスコアの高い設定を表示する")
+    rank_parser.add_argument("nuclide", nargs="?", help="核種名 (例: 99Zr, 省略すると全核種)")
+    rank_parser.add_argument("--by", choices=list(RANKING_SCORES), default="yield", help="並べ替えの基準")
+    rank_parser.add_argument("--weight", type=float, default=0.5, help="weighted での収量の重み (0 ~ 1)")
+    rank_parser.add_argument("--min-purity", type=float, default=None, help="percent1 の下限")
+    rank_parser.add_argument("--top", type=int, default=5, help="核種ごとに表示する設定の数")
+    args = parser.parse_args()
+
+    if args.command == "settings":
+        filters = dict(parse_filter(argument) for argument in args.filters)
+        lpp = {name: filters.pop(name) for name in list(filters) if name.startswith(("[", "$"))}
+        for row in find_settings(args.db, lpp, **filters):
+            brho = ", ".join(f"{row[f'D{i}_Brho']:.4f}" for i in range(1, 9))
+            print(f"{row['id']:>4d}  {row['Symbol']:>6s}  F1t={row['F1t']}  F5t={row['F5t']}  Brho=[{brho}]")
+    else:
+        for row in rank_settings(args.nuclide, by=args.by, weight=args.weight, min_purity=args.min_purity,
+                                 top=args.top, db_path=args.db):
+            print(f"{row['isotope_name']:>6s}  #{row['rank']}  ID {row['setting_id']:>3d} ({row['Symbol']:>6s})  "
+                  f"Yield={row['Yield']:.3g}  percent1={row['percent1']:.2f}  Transmission={row['Transmission']:.3g}  "
+                  f"score={row['score']:.3g}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+import sys
+import json
+import hashlib
+
+import dbconn
+
+# ===== settings.db のスキーマ ========================================================================
+# スキーマは MIGRATIONS の順番に適用する変更の列で表し、適用済みの数を PRAGMA user_version に記録する
+#   スキーマを変えるときは、既存の関数を書き換えずに MIGRATIONS の末尾に関数を追加する
+#   (列の追加 -> 既存の行から埋める -> 索引を作る、のように DB を作り直さずに済む形で書く)
+#   user_version を記録する前の DB (0) にも適用できるように、どの関数も 2 回目の適用で何も変えない形にする
+
+# 1: settings と isotopes
+def create_base_tables(cursor):
+    # 設定テーブルの作成
+    cursor.execute('''CREATE TABLE IF NOT EXISTS settings (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        hash TEXT UNIQUE,
+                        Model TEXT,
+                        Coeff REAL,
+                        Nuclide TEXT,
+                        Intensity REAL,
+                        Symbol TEXT,
+                        A INTEGER,
+                        Z INTEGER,
+                        N INTEGER,
+                        F0Be REAL,
+                        F1t REAL,
+                        F1a REAL,
+                        F5Mat REAL,
+                        F5t REAL,
+                        F5a REAL,
+                        D1_Brho REAL,
+                        D2_Brho REAL,
+                        D3_Brho REAL,
+                        D4_Brho REAL,
+                        D5_Brho REAL,
+                        D6_Brho REAL,
+                        D7_Brho REAL,
+                        D8_Brho REAL,
+                        D1_Energy REAL,
+                        D2_Energy REAL,
+                        D3_Energy REAL,
+                        D4_Energy REAL,
+                        D5_Energy REAL,
+                        D6_Energy REAL,
+                        D7_Energy REAL,
+                        D8_Energy REAL,
+                        DumpL REAL,
+                        DumpR REAL,
+                        F1L REAL, 
+                        F1R REAL, 
+                        F2L REAL, 
+                        F2R REAL, 
+                        F25XL REAL,
+                        F25XR REAL,
+                        F25YL REAL,
+                        F25YR REAL,
+                        F5L REAL, 
+                        F5R REAL, 
+                        F7L REAL, 
+                        F7R REAL 
+                    )''')
+
+    # 同位体情報を保存するためのテーブル作成
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS isotopes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            setting_id INTEGER,
+            isotope_name TEXT,
+            A INTEGER,
+            Z INTEGER,
+            N INTEGER,
+            Yield REAL,
+            percent1 REAL,
+            x_section REAL,
+            Transmission REAL,
+            Transmission_F1slit REAL,
+            Transmission_F2slit REAL,
+            Transmission_F25slit REAL,
+            Transmission_F5slit REAL,
+            Transmission_F7slit REAL,
+            Qratio_F3 REAL,
+            Qratio_F5 REAL,
+            Unreacted_F5 REAL,
+            UNIQUE(setting_id, isotope_name)  -- setting_id と isotope_name の組み合わせでユニーク制約を追加
+            FOREIGN KEY (setting_id) REFERENCES settings(id)
+        )
+    ''')
+
+# 2: 取り込み済み LPP ファイル
+def create_lpp_files(cursor):
+    # 取り込み済み LPP ファイルのテーブル (生バイト列 + PARSER_VERSION の SHA-256 -> setting_id)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lpp_files (
+            content_hash TEXT PRIMARY KEY,
+            parser_version INTEGER,
+            setting_id INTEGER,
+            file_path TEXT,
+            ingested_at TEXT,
+            FOREIGN KEY (setting_id) REFERENCES settings(id)
+        )
+    ''')
+
+# 3: [Calculations] の NPY ファイル
+def create_calculation_files(cursor):
+    # [Calculations] の全数値を保存した NPY ファイルのテーブル
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS calculation_files (
+            setting_id INTEGER PRIMARY KEY,
+            path TEXT,
+            labels_path TEXT,
+            n_rows INTEGER,
+            n_cols INTEGER,
+            dtype TEXT,
+            FOREIGN KEY (setting_id) REFERENCES settings(id)
+        )
+    ''')
+
+# 4: 荷電状態ごとの全行と核種ごとの合計
+def create_charge_states(cursor):
+    # 荷電状態ごとの全行のテーブル (charges は D1 ~ D8 の荷電状態を int8 で並べたバイト列)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS charge_states (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            setting_id INTEGER,
+            row_index INTEGER,
+            isotope_name TEXT,
+            A INTEGER,
+            Z INTEGER,
+            N INTEGER,
+            charges BLOB,
+            fully_stripped INTEGER,
+            Yield REAL,
+            percent1 REAL,
+            UNIQUE(setting_id, row_index),
+            FOREIGN KEY (setting_id) REFERENCES settings(id)
+        )
+    ''')
+
+    # 核種ごとの荷電状態の合計 (全荷電状態 / 全ダイポールで完全電離)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS charge_state_totals (
+            setting_id INTEGER,
+            isotope_name TEXT,
+            A INTEGER,
+            Z INTEGER,
+            N INTEGER,
+            n_rows INTEGER,
+            Yield_all REAL,
+            Yield_fully_stripped REAL,
+            contamination REAL,
+            PRIMARY KEY (setting_id, isotope_name),
+            FOREIGN KEY (setting_id) REFERENCES settings(id)
+        )
+    ''')
+
+# 5: 核種 ID の列
+def add_nuclide_ids(cursor):
+    # 核種 ID (nuclide.py) の索引 (列を追加して A, Z から埋める)
+    for table in ("isotopes", "charge_states", "charge_state_totals"):
+        if add_column(cursor, table, "nuclide_id", "INTEGER"):
+            cursor.execute(f"UPDATE {table} SET nuclide_id = Z * 1000 + A")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_nuclide_id ON {table}(nuclide_id)")
+
+# 6: 設定のフィンガープリントと粗いキー
+def add_settings_fingerprint(cursor):
+    # 設定のフィンガープリントと粗いキーの索引 (列を追加して既存の行から計算する)
+    add_column(cursor, "settings", "fingerprint", "TEXT")
+    add_column(cursor, "settings", "coarse_key", "TEXT")
+    cursor.execute("SELECT * FROM settings WHERE fingerprint IS NULL")
+    names = [description[0] for description in cursor.description]
+    for values in cursor.fetchall():
+        row = dict(zip(names, values))
+        cursor.execute("UPDATE settings SET fingerprint = ?, coarse_key = ? WHERE id = ?",
+                       (settings_fingerprint(row), settings_coarse_key(row), row["id"]))
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_settings_fingerprint ON settings(fingerprint)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_settings_coarse_key ON settings(coarse_key)")
+
+# 7: 検索でよく使う settings の列の索引
+def index_settings_columns(cursor):
+    # 検索でよく使う列の索引 (query.find_settings() の範囲検索用)
+    for column in SETTINGS_INDEXED_COLUMNS:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_settings_{column} ON settings({column})")
+
+# 8: 核種 -> 設定の逆引き表
+def create_nuclide_settings(cursor):
+    # 核種 -> 設定の逆引き表 ((Z, N) 順に並んだ WITHOUT ROWID テーブル)
+    #   isotopes に行が入る / 消えるたびにトリガーで更新するので、取り込みのたびに作り直す必要はない
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS nuclide_settings (
+            Z INTEGER,
+            N INTEGER,
+            setting_id INTEGER,
+            nuclide_id INTEGER,
+            isotope_name TEXT,
+            Yield REAL,
+            percent1 REAL,
+            Transmission REAL,
+            PRIMARY KEY (Z, N, setting_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_nuclide_settings_nuclide_id ON nuclide_settings(nuclide_id)")
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_isotopes_nuclide_settings_insert AFTER INSERT ON isotopes
+        BEGIN
+            INSERT OR REPLACE INTO nuclide_settings (Z, N, setting_id, nuclide_id, isotope_name, Yield, percent1, Transmission)
+            VALUES (NEW.Z, NEW.N, NEW.setting_id, NEW.nuclide_id, NEW.isotope_name, NEW.Yield, NEW.percent1, NEW.Transmission);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_isotopes_nuclide_settings_delete AFTER DELETE ON isotopes
+        BEGIN
+            DELETE FROM nuclide_settings WHERE Z = OLD.Z AND N = OLD.N AND setting_id = OLD.setting_id;
+        END
+    ''')
+
+    # 既にある isotopes の行を入れる
+    cursor.execute('''
+        INSERT OR IGNORE INTO nuclide_settings (Z, N, setting_id, nuclide_id, isotope_name, Yield, percent1, Transmission)
+        SELECT Z, N, setting_id, nuclide_id, isotope_name, Yield, percent1, Transmission FROM isotopes
+    ''')
+
+# 9: 設定ごとの集計
+def create_setting_summary(cursor):
+    # 設定ごとの集計 (取り込み時に update_setting_summary() で更新し、HTML/ROOT 生成側はこれを読む)
+    #   total_yield: 保存した核種の Yield の合計, n_nuclides: 保存した核種の数,
+    #   top_nuclides: Yield の大きい核種 (JSON: [[核種名, Yield, percent1], ...]),
+    #   center_purity: 中心核種の percent1, f7_rate: [Calculations] の全行 (全荷電状態) の Yield の合計
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS setting_summary (
+            setting_id INTEGER PRIMARY KEY,
+            total_yield REAL,
+            n_nuclides INTEGER,
+            top_nuclides TEXT,
+            center_purity REAL,
+            f7_rate REAL,
+            FOREIGN KEY (setting_id) REFERENCES settings(id)
+        )
+    ''')
+
+    # 集計のない既存の設定の集計を作る
+    cursor.execute("SELECT id FROM settings WHERE id NOT IN (SELECT setting_id FROM setting_summary)")
+    for (setting_id,) in cursor.fetchall():
+        update_setting_summary(cursor, setting_id)
+
+# 10: LPP の全 [section] key = value (JSON) と、よく検索するパスの式索引
+#   既存の設定の JSON は LPP を取り込み直すと入る (PARSER_VERSION が変わったのでキャッシュは効かない)
+def create_setting_params(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS setting_params (
+            setting_id INTEGER PRIMARY KEY,
+            params TEXT,
+            FOREIGN KEY (setting_id) REFERENCES settings(id)
+        )
+    ''')
+    for index, (path, numeric) in enumerate(PARAM_INDEXES.items(), start=1):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_setting_params_{index} ON setting_params({param_expression(path, numeric)})")
+
+MIGRATIONS = [
+    create_base_tables,
+    create_lpp_files,
+    create_calculation_files,
+    create_charge_states,
+    add_nuclide_ids,
+    add_settings_fingerprint,
+    index_settings_columns,
+    create_nuclide_settings,
+    create_setting_summary,
+    create_setting_params,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# DB のスキーマのバージョン (PRAGMA user_version)
+def schema_version(cursor):
+    return cursor.execute("PRAGMA user_version").fetchone()[0]
+
+# 未適用の変更を順番に適用する関数 (適用した変更の数を返す)
+def migrate(cursor):
+    version = schema_version(cursor)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"DB のスキーマ ({version}) がこのスクリプト ({SCHEMA_VERSION}) より新しいです")
+
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        MIGRATIONS[number - 1](cursor)
+        cursor.execute(f"PRAGMA user_version = {number}")
+    return SCHEMA_VERSION - version
+
+# 索引を作る settings の列
+SETTINGS_INDEXED_COLUMNS = ["Symbol"] + [f"D{i}_Brho" for i in range(1, 9)] + ["F1t", "F5t"]
+
+# setting_summary に載せる核種の数 (Yield の大きい順)
+SUMMARY_TOP_NUCLIDES = 10
+
+# 設定 1 つの集計を isotopes から作り直す関数
+#   f7_rate は全行の Yield の合計 (insert_isotopes() の total_sum)。省略すると charge_states から求め、
+#   charge_states がない古い DB では percent1 = 100 * Yield / total_sum から逆算する
+def update_setting_summary(cursor, setting_id, f7_rate=None):
+    if f7_rate is None:
+        cursor.execute("SELECT SUM(Yield) FROM charge_states WHERE setting_id = ?", (setting_id,))
+        f7_rate = cursor.fetchone()[0]
+    if f7_rate is None:
+        cursor.execute("SELECT 100 * Yield / percent1 FROM isotopes WHERE setting_id = ? AND percent1 > 0 ORDER BY Yield DESC LIMIT 1",
+                       (setting_id,))
+        row = cursor.fetchone()
+        f7_rate = row[0] if row is not None else None
+
+    cursor.execute("SELECT SUM(Yield), COUNT(*) FROM isotopes WHERE setting_id = ?", (setting_id,))
+    total_yield, n_nuclides = cursor.fetchone()
+
+    cursor.execute("SELECT isotope_name, Yield, percent1 FROM isotopes WHERE setting_id = ? ORDER BY Yield DESC LIMIT ?",
+                   (setting_id, SUMMARY_TOP_NUCLIDES))
+    top_nuclides = json.dumps([list(row) for row in cursor.fetchall()])
+
+    cursor.execute('''
+        SELECT I.percent1 FROM isotopes I JOIN settings S ON S.id = I.setting_id
+        WHERE I.setting_id = ? AND I.isotope_name = S.Symbol
+    ''', (setting_id,))
+    row = cursor.fetchone()
+    center_purity = row[0] if row is not None else None
+
+    cursor.execute('''
+        INSERT OR REPLACE INTO setting_summary (setting_id, total_yield, n_nuclides, top_nuclides, center_purity, f7_rate)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (setting_id, total_yield, n_nuclides, top_nuclides, center_purity, f7_rate))
+
+# ===== LPP の全パラメータ (setting_params) ==========================================================
+# 式索引を作る JSON パス -> 数値として比べるか
+#   数値のパスは "345   MeV/u" のような単位付きの値も CAST で先頭の数値になる
+#   パスを追加するときは、索引を作る変更を MIGRATIONS に追加する
+PARAM_INDEXES = {
+    '$.settings.Energy': True,
+    '$.settings.Intensity': True,
+    '$.settings."RF frequency"': True,
+    '$.settings."A,Z,Q"': False,
+    '$.settings."Settings on A,Z"': False,
+}
+
+# JSON パスの値を取り出す SQL 式 (索引を使うには索引と同じ式で検索する必要がある)
+def param_expression(path, numeric, column="params"):
+    expression = f"json_extract({column}, '{path.replace(chr(39), chr(39) * 2)}')"
+    return f"CAST({expression} AS REAL)" if numeric else expression
+
+# "[section]key" を JSON パスにする関数 (例: "[settings]RF frequency" -> '$.settings."RF frequency"')
+def param_path(section, key):
+    def quote(name):
+        return name if name.isidentifier() else '"' + name.replace('"', '\\"') + '"'
+    return f"$.{quote(section)}.{quote(key)}"
+
+# テーブルに列がなければ追加する関数 (追加した場合は True)
+def add_column(cursor, table, column, declaration):
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column in columns:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    return True
+
+# ===== 設定のフィンガープリント =================================================================
+# フィンガープリントに含めない列 (DB の管理用の列と、ほかの列から計算される列)
+FINGERPRINT_EXCLUDED_COLUMNS = {"id", "hash", "fingerprint", "coarse_key", "N"} | {f"D{i}_Energy" for i in range(1, 9)}
+
+# 粗いキーに使う列 (ビーム, 中心核種, 標的と楔の厚さ) と Brho を丸める小数点以下の桁数
+#   粗いキーが同じ設定 = スリット幅などだけが違う設定
+COARSE_KEY_COLUMNS = ["Nuclide", "Symbol", "F0Be", "F1t", "F5t"]
+COARSE_BRHO_DIGITS = 3
+
+# build_settings() の辞書を settings テーブルの列名の辞書にする関数 ("F2.5XL" -> "F25XL")
+def settings_row(settings):
+    return {key.replace('.', ''): value for key, value in settings.items()}
+
+# 値を型付きの正規形にする関数
+#   数値として読めるものは有効数字 12 桁の float ("0.002" も 0.002 も同じ値), それ以外は前後の空白を除いた文字列
+def canonical_value(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return value.strip()
+    return float(f"{float(value):.12g}")
+
+# 設定のフィンガープリント (列名の順番や数値の書き方によらない SHA-256)
+def settings_fingerprint(row):
+    canonical = {key: canonical_value(value) for key, value in row.items()
+                 if key not in FINGERPRINT_EXCLUDED_COLUMNS}
+    text = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+# 設定の粗いキー (JSON 文字列: [ビーム, 中心核種, F0Be, F1t, F5t, D1_Brho, ..., D8_Brho])
+def settings_coarse_key(row):
+    key = [canonical_value(row[column]) for column in COARSE_KEY_COLUMNS]
+    key += [round(float(row[f"D{i}_Brho"]), COARSE_BRHO_DIGITS) for i in range(1, 9)]
+    return json.dumps(key, separators=(',', ':'))
+
+# 使い方: python3 ./PYN/schema.py [settings.db]
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else dbconn.DB_PATH
+    conn = dbconn.connect(db_path)
+    with conn:
+        applied = migrate(conn.cursor())
+    conn.close()
+    print(f"{db_path}: {applied} 個の変更を適用しました (スキーマのバージョン: {SCHEMA_VERSION})")
@@ -1,23 +1,21 @@
 import os
 import subprocess
 import glob
-import time
+
+from lise2db import ingest_files, available_cores
 
 # 設定
 SHARE_DIR = "./LPP/SHARE"
-SH_SCRIPT = "./SH/lise2root.sh"
+DB_PATH = "settings.db"
 
 def main():
-    # ディレクトリとスクリプトの存在チェック
+    # ディレクトリの存在チェック
     if not os.path.isdir(SHARE_DIR):
         print(f"エラー: {SHARE_DIR} ディレクトリが見つかりません")
         return
 
-    if not os.path.isfile(SH_SCRIPT):
-        print(f"エラー: {SH_SCRIPT} スクリプトが見つかりません")
-        return
-
-    # 01から14まで順番に処理
+    # 01から14まで順番に対象ファイルを集める
+    file_paths = []
     for i in range(1, 15):
         num = f"{i:02d}"
         pattern = os.path.join(SHARE_DIR, f"BigRIPS_No{num}_136Xe_*.lpp")
@@ -27,32 +25,21 @@ def main():
             print(f"警告: No{num} に対応するファイルが見つかりません")
             continue
 
-        file_path = files[0]  # パターンにマッチする最初のファイル
-        print(f"処理中: {file_path}")
-
-        try:
-            # ファイルをコピー
-            subprocess.run(['cp', file_path, './LPP/temp.lpp'], check=True)
-            
-            # スクリプトを実行
-            print(f"実行中: {SH_SCRIPT}")
-            subprocess.run([SH_SCRIPT], check=True)
-            
-            # 処理完了後の待機時間
-            time.sleep(1)
-
-        except subprocess.CalledProcessError as e:
-            print(f"エラー: コマンド実行中にエラーが発生しました: {e}")
-        except Exception as e:
-            print(f"エラー: 予期せぬエラーが発生しました: {e}")
-
-    # 後処理
-    if os.path.exists('./LPP/temp.lpp'):
-        try:
-            os.remove('./LPP/temp.lpp')
-            print("一時ファイル ./LPP/temp.lpp を削除しました")
-        except Exception as e:
-            print(f"警告: 一時ファイルの削除に失敗しました: {e}")
+        file_paths.append(files[0])  # パターンにマッチする最初のファイル
+
+    try:
+        # 解析は全コアで並列、書き込みは 1 接続・1 トランザクションでまとめて行う
+        ingest_files(file_paths, DB_PATH, available_cores())
+
+        # HTML と ROOT は全設定の取り込み後に 1 回だけ生成
+        for script in ["./PYN/db2html.py", "./PYN/db2root.py"]:
+            print(f"実行中: {script}")
+            subprocess.run(["python3", script], check=True)
+
+    except subprocess.CalledProcessError as e:
+        print(f"エラー: コマンド実行中にエラーが発生しました: {e}")
+    except Exception as e:
+        print(f"エラー: 予期せぬエラーが発生しました: {e}")
 
     print("すべての処理が完了しました")
 
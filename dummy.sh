@@ -1,15 +1,4 @@
-rm settings.db
-cp ./LPP/SHARE/BigRIPS_No01_136Xe_95Zr.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No02_136Xe_99Zr.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No03_136Xe_65Ga.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No04_136Xe_50V.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No05_136Xe_53V.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No06_136Xe_61Fe.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No07_136Xe_91Zr.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No08_136Xe_87Zr.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No09_136Xe_99Zr.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No10_136Xe_103Zr.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No11_136Xe_55V.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No12_136Xe_64Fe.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No13_136Xe_68Ga.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
-cp ./LPP/SHARE/BigRIPS_No14_136Xe_71Ga.lpp ./LPP/temp.lpp && ./SH/lise2root.sh
+python3 ./PYN/schema.py ./settings.db
+python3 ./PYN/lise2db.py "./LPP/SHARE/BigRIPS_No*_136Xe_*.lpp"
+python3 ./PYN/db2html.py
+python3 ./PYN/db2root.py